@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Montage Benchmark for Cench AI
+Times the montage pipeline stages on synthetic photos
+"""
+
+import sys
+import os
+import json
+import time
+import wave
+import shutil
+import tempfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from montage_generator import CrossfadeKernel, MontageGenerator, create_montage, prepare_canvas, resolve_workers
+from montage_progress import ProgressReporter
+
+# Photo shapes and formats the synthetic corpora cycle through
+CORPUS_SIZES = [(4032, 3024), (3000, 2000), (1920, 1080), (2048, 2048), (1080, 1920), (640, 480), (3024, 4032)]
+CORPUS_FORMATS = [("jpg", "JPEG"), ("png", "PNG"), ("bmp", "BMP")]
+
+# End-to-end scenarios of the suite: corpus, audio and create_montage options.
+# "cache" renders with a scratch cache_dir; "warm" fills it with an untimed render first
+SCENARIOS = {
+    "final": {"photos": 8, "audio": "tone", "options": {"encoder": "ffmpeg", "backend": "frames"}},
+    "final-holds": {"photos": 8, "audio": "tone",
+                    "options": {"encoder": "ffmpeg", "backend": "frames", "hold_duration": 2.0}},
+    "draft": {"photos": 8, "audio": "silent", "options": {"profile": "draft"}},
+    "streaming": {"photos": 16, "audio": "tone", "options": {"streaming": True, "memory_limit_mb": 256}},
+    "filtergraph": {"photos": 8, "audio": "tone", "options": {"backend": "auto"}},
+    "chunked": {"photos": 8, "audio": "tone", "options": {"encoder": "ffmpeg", "render_workers": 2}},
+    "segments-cold": {"photos": 8, "audio": "tone", "cache": "cold", "options": {"encoder": "ffmpeg"}},
+    "segments-warm": {"photos": 8, "audio": "tone", "cache": "warm", "options": {"encoder": "ffmpeg"}},
+    # Past the filter graph's photo bound; the full timeline keeps every photo in play
+    "final-400": {"photos": 400, "photo_size": (320, 240), "audio": "tone", "seconds": 10,
+                  "options": {"encoder": "ffmpeg", "x264_preset": "ultrafast", "music_fit": "loop"}},
+    # Flat memory at thousands of photos, with the VFR hold retiming that grows with the timeline
+    "streaming-holds-3000": {"photos": 3000, "photo_size": (320, 240), "audio": "tone", "seconds": 10,
+                             "options": {"streaming": True, "profile": "draft", "hold_duration": 0.5,
+                                         "memory_limit_mb": 64, "music_fit": "loop"}},
+}
+
+# Metrics compared against a baseline; all of them are worse when higher
+BASELINE_METRICS = ("wall_seconds", "peak_rss_mb", "output_bytes")
+
+
+def make_photos(directory: str, count: int, size=(4032, 3024)) -> list:
+    """Write deterministic synthetic photos to a directory"""
+    rng = np.random.default_rng(1234)
+    paths = []
+    for i in range(count):
+        # Alternate landscape and portrait so letterboxing is exercised
+        width, height = size if i % 2 == 0 else size[::-1]
+        base = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize((width, height), Image.Resampling.BILINEAR)
+        path = os.path.join(directory, f"photo_{i:03d}.jpg")
+        img.save(path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def make_corpus(directory: str, count: int, seed: int = 1234, size=None) -> list:
+    """Write a deterministic corpus of photos in varied sizes (or one size), aspect ratios and formats"""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        width, height = size or CORPUS_SIZES[i % len(CORPUS_SIZES)]
+        extension, image_format = CORPUS_FORMATS[i % len(CORPUS_FORMATS)]
+        # Low-frequency noise compresses like a photo rather than like static
+        base = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize((width, height), Image.Resampling.BICUBIC)
+        path = os.path.join(directory, f"corpus_{i:03d}.{extension}")
+        img.save(path, image_format)
+        paths.append(path)
+    return paths
+
+
+def make_audio(path: str, duration: float, kind: str = "tone", sample_rate: int = 44100) -> str:
+    """Write a mono 16-bit WAV track: a 440 Hz tone or silence"""
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    samples = 0.2 * np.sin(2 * np.pi * 440 * t) if kind == "tone" else np.zeros_like(t)
+    with wave.open(path, 'wb') as track:
+        track.setnchannels(1)
+        track.setsampwidth(2)
+        track.setframerate(sample_rate)
+        track.writeframes((samples * 32767).astype('<i2').tobytes())
+    return path
+
+
+def run_scenario(name: str, scenario: dict) -> dict:
+    """Render one scenario end to end with create_montage and measure it
+    
+    Runs in a fresh process so the peak RSS is the scenario's own.
+    """
+    work_dir = tempfile.mkdtemp(prefix=f"cench_bench_{name}_")
+    try:
+        photos = make_corpus(work_dir, scenario["photos"], size=scenario.get("photo_size"))
+        music = make_audio(os.path.join(work_dir, "music.wav"), scenario.get("seconds", 60), scenario["audio"])
+        # Keep the benchmark's montages out of the user's montage folder and library
+        options = dict(scenario["options"], reuse_outputs=False, output_dir=os.path.join(work_dir, "out"))
+        if scenario.get("cache"):
+            options["cache_dir"] = os.path.join(work_dir, "cache")
+        if scenario.get("cache") == "warm":
+            create_montage(photos, music, **options)
+        
+        stages = {}
+        current = {"stage": "start", "since": time.perf_counter()}
+        
+        def on_event(event):
+            if event.stage != current["stage"]:
+                now = time.perf_counter()
+                stages[current["stage"]] = stages.get(current["stage"], 0.0) + now - current["since"]
+                current.update(stage=event.stage, since=now)
+        
+        frames = sum(segment["frames"] for segment in MontageGenerator(**options).timeline_segments(len(photos)))
+        start = time.perf_counter()
+        result = create_montage(photos, music, ProgressReporter(on_event, max_rate=1), **options)
+        wall = time.perf_counter() - start
+        if not result["success"]:
+            raise RuntimeError(f"{name}: {result['error']}")
+        
+        return {
+            "wall_seconds": round(wall, 3),
+            "stages": {stage: round(seconds, 3) for stage, seconds in stages.items()},
+            "frames": frames,
+            "frames_per_second": round(frames / wall, 1),
+            "peak_rss_mb": result["peak_rss_mb"],
+            "output_bytes": os.path.getsize(result["output_path"]),
+        }
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run_suite(names: list) -> dict:
+    """Run scenarios one by one, each in its own process"""
+    results = {}
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(run_scenario, name, SCENARIOS[name]).result()
+        metrics = results[name]
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in metrics["stages"].items())
+        print(f"   • {name + ':':<20} {metrics['wall_seconds']:.2f}s, {metrics['frames_per_second']:.1f} frames/s, "
+              f"{metrics['peak_rss_mb']:.0f} MB peak, {metrics['output_bytes'] / 1e6:.1f} MB ({stages})")
+    return results
+
+
+def compare_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse than the baseline by more than tolerance (a fraction)"""
+    regressions = []
+    for name, metrics in results.items():
+        for metric in BASELINE_METRICS:
+            before = baseline.get(name, {}).get(metric)
+            if before and metrics[metric] > before * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {before} -> {metrics[metric]}")
+    return regressions
+
+
+def time_process_photos(photo_paths: list, workers: int) -> float:
+    """Time MontageGenerator.process_photos with the given worker count"""
+    generator = MontageGenerator(workers=workers)
+    generator.create_temp_directory()
+    try:
+        start = time.perf_counter()
+        processed = generator.process_photos(photo_paths)
+        elapsed = time.perf_counter() - start
+        assert len(processed) == len(photo_paths)
+        return elapsed
+    finally:
+        generator.cleanup_temp_directory()
+
+
+def bench_preprocessing(photo_paths: list, workers: int):
+    """Compare serial and process-pool photo preprocessing"""
+    print(f"\n📷 Photo preprocessing ({len(photo_paths)} photos)")
+    serial = time_process_photos(photo_paths, 1)
+    print(f"   • {'Serial:':<20} {serial:.2f}s ({len(photo_paths) / serial:.1f} photos/s)")
+    parallel = time_process_photos(photo_paths, workers)
+    print(f"   • {f'{workers} workers:':<20} {parallel:.2f}s ({len(photo_paths) / parallel:.1f} photos/s)")
+    print(f"   • {'Speedup:':<20} {serial / parallel:.2f}x")
+
+
+def bench_blend(photo_paths: list, workers: int, transition_frames: int = 30):
+    """Compare per-frame cv2.addWeighted with the batched CrossfadeKernel
+    
+    Every frame is copied into a sink buffer, like handing it to the encoder.
+    """
+    canvases = [prepare_canvas(path) for path in photo_paths]
+    pairs = list(zip(canvases, canvases[1:]))
+    frames = len(pairs) * transition_frames
+    # Touch the sink up front so page faults are not charged to either loop
+    sink = bytearray(canvases[0].tobytes())
+    print(f"\n🌗 Crossfade blending ({frames} frames at 1920x1080)")
+    
+    start = time.perf_counter()
+    for img1, img2 in pairs:
+        for frame in range(transition_frames):
+            alpha = frame / transition_frames
+            sink[:] = memoryview(cv2.addWeighted(img1, 1.0 - alpha, img2, alpha, 0)).cast('B')
+    before = frames / (time.perf_counter() - start)
+    print(f"   • {'addWeighted:':<20} {before:.1f} frames/s")
+    
+    kernel = CrossfadeKernel(threads=workers)
+    start = time.perf_counter()
+    for img1, img2 in pairs:
+        for batch in kernel.render(img1, img2, transition_frames):
+            for blended in batch:
+                sink[:] = memoryview(blended).cast('B')
+    after = frames / (time.perf_counter() - start)
+    kernel.close()
+    print(f"   • {f'Kernel ({workers} threads):':<20} {after:.1f} frames/s")
+    print(f"   • {'Speedup:':<20} {after / before:.2f}x")
+
+
+def time_generate_montage(photo_paths: list, output_dir: str, **options) -> float:
+    """Time a full MontageGenerator.generate_montage run"""
+    # Identical runs would otherwise return the first run's saved output
+    options.setdefault("reuse_outputs", False)
+    generator = MontageGenerator(**options)
+    generator.output_dir = Path(output_dir)
+    start = time.perf_counter()
+    result = generator.generate_montage(photo_paths)
+    elapsed = time.perf_counter() - start
+    assert result['success'], result.get('error')
+    return elapsed
+
+
+def bench_backends(photo_paths: list, output_dir: str, workers: int):
+    """Compare the frame loop, the ffmpeg filter graph and parallel chunk rendering"""
+    print(f"\n🎞️  Render backends ({len(photo_paths)} photos, libx264 veryfast)")
+    encoder = dict(encoder="ffmpeg", x264_preset="veryfast", workers=workers)
+    frames = time_generate_montage(photo_paths, output_dir, backend="frames", in_memory=True, **encoder)
+    print(f"   • {'Frame loop:':<20} {frames:.2f}s")
+    graph = time_generate_montage(photo_paths, output_dir, backend="auto", **encoder)
+    print(f"   • {'Filter graph:':<20} {graph:.2f}s")
+    print(f"   • {'Speedup:':<20} {frames / graph:.2f}x")
+    chunks = time_generate_montage(photo_paths, output_dir, render_workers=workers, **encoder)
+    print(f"   • {f'{workers} render workers:':<20} {chunks:.2f}s")
+    print(f"   • {'Speedup:':<20} {frames / chunks:.2f}x")
+
+
+def bench_profiles(photo_paths: list, output_dir: str, workers: int):
+    """Compare draft preview latency with the final render"""
+    print(f"\n👀 Render profiles ({len(photo_paths)} photos)")
+    final = time_generate_montage(photo_paths, output_dir, workers=workers, encoder="ffmpeg")
+    print(f"   • {'Final 1080p30:':<20} {final:.2f}s")
+    draft = time_generate_montage(photo_paths, output_dir, workers=workers, encoder="ffmpeg", profile="draft")
+    print(f"   • {'Draft 480p12:':<20} {draft:.2f}s")
+    print(f"   • {'Speedup:':<20} {final / draft:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the montage pipeline")
+    parser.add_argument('--photos', type=int, default=24, help="number of synthetic photos")
+    parser.add_argument('--workers', type=int, default=0, help="worker processes (0 = one per CPU)")
+    parser.add_argument('--suite', nargs='*', choices=sorted(SCENARIOS),
+                        help="run end-to-end scenarios (all if none are named) instead of the stage benchmarks")
+    parser.add_argument('--baseline', help="JSON baseline to check the suite against")
+    parser.add_argument('--save-baseline', help="write the suite results as a JSON baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown or growth (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print("🎬 MONTAGE BENCHMARK")
+    print("="*50)
+
+    if args.suite is not None:
+        print("\n📊 End-to-end scenarios")
+        results = run_suite(args.suite or list(SCENARIOS))
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\n💾 Baseline saved to {args.save_baseline}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_baseline(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"❌ Regression: {regression}")
+            if regressions:
+                sys.exit(1)
+            print("✅ No regressions against the baseline")
+        sys.exit(0)
+
+    corpus_dir = tempfile.mkdtemp(prefix="cench_bench_")
+    try:
+        photos = make_photos(corpus_dir, args.photos)
+        bench_preprocessing(photos, resolve_workers(args.workers))
+        bench_blend(photos, resolve_workers(args.workers))
+        bench_backends(photos, corpus_dir, resolve_workers(args.workers))
+        bench_profiles(photos, corpus_dir, resolve_workers(args.workers))
+    finally:
+        shutil.rmtree(corpus_dir)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Montage Cache for Cench AI
+Persistent, size-bounded caches for montage rendering
+"""
+
+import os
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "cench" / "montage"
+
+
+_digests = {}
+
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's contents, memoized while the file is unchanged"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _digests:
+        return _digests[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    _digests[memo_key] = digest.hexdigest()
+    return _digests[memo_key]
+
+
+def settings_digest(*parts) -> str:
+    """Short stable hash of render settings for use in cache keys"""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+class FileCache:
+    """Persistent directory of content-addressed files with LRU eviction
+
+    Files are touched on every hit and the least recently used ones are
+    evicted once the cache grows past max_bytes. Entries handed out while a
+    render holds the cache are pinned so a running render never loses a file
+    it still has to read; with several renders sharing one cache, the pins
+    are released when the last of them calls unpin_all().
+    """
+
+    SUFFIX = ""
+    SUBDIRECTORY = ""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR / self.SUBDIRECTORY
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pinned = set()
+        self.holders = 0
+        self.lock = threading.Lock()
+        self.size = sum(entry.stat().st_size for entry in self.cache_dir.glob(f'*{self.SUFFIX}'))
+
+    def path(self, key: str) -> str:
+        """File holding the entry for a key"""
+        return str(self.cache_dir / f"{key}{self.SUFFIX}")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Return the entry path on a hit (marking it recently used), else None"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+            self.pin(path)
+        return path
+
+    def added(self, path: str):
+        """Account for an entry written to the cache directory, possibly by another process"""
+        with self.lock:
+            self.size += os.path.getsize(path)
+            self.pin(path)
+            over_budget = self.size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def pin(self, path: str):
+        """Protect an entry from eviction if a render holds the cache; call with the lock held
+
+        Lookups outside a render (the preview frame server, for one) have no
+        unpin_all() to release them, so they are not pinned.
+        """
+        if self.holders:
+            self.pinned.add(path)
+
+    def hold(self):
+        """Mark the start of a render whose entries must stay pinned until its unpin_all()"""
+        with self.lock:
+            self.holders += 1
+
+    def unpin_all(self):
+        """Release the entries of a finished render and enforce the budget again"""
+        with self.lock:
+            self.holders = max(0, self.holders - 1)
+            if self.holders:
+                # Another render still reads entries handed out before now
+                return
+            self.pinned.clear()
+            over_budget = self.size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its budget"""
+        with self.lock:
+            entries = []
+            for entry in self.cache_dir.glob(f'*{self.SUFFIX}'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+            entries.sort()
+
+            self.size = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if self.size <= self.max_bytes:
+                    break
+                if str(entry) in self.pinned:
+                    continue
+                try:
+                    entry.unlink()
+                except FileNotFoundError:
+                    pass
+                self.size -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current footprint, for sizing the cache"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class CanvasCache(FileCache):
+    """Content-addressed LRU cache of letterboxed photo canvases
+
+    Entries are raw .npy files keyed by the source file's content hash plus
+    the target size and resample settings, so they can be memory-mapped back
+    without any decoding.
+    """
+
+    SUFFIX = ".npy"
+    SUBDIRECTORY = "canvases"
+    VERSION = 1
+
+    def key(self, photo_path: str, target_size, resample: str = "lanczos") -> str:
+        """Cache key for a photo rendered at target_size with the given resampling"""
+        width, height = target_size
+        return f"{file_digest(photo_path)}_{width}x{height}_{resample}_v{self.VERSION}"
+
+    def get(self, key: str, mmap: bool = False) -> Optional[np.ndarray]:
+        """Load a cached canvas, or None on a miss"""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return np.load(path, mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, canvas: np.ndarray) -> str:
+        """Store a canvas and evict old entries if the cache is over budget"""
+        path = self.path(key)
+        store(path, canvas)
+        self.added(path)
+        return path
+
+
+class SegmentCache(FileCache):
+    """Content-addressed LRU cache of encoded montage timeline segments
+
+    Each hold or transition is its own self-contained H.264 file starting on
+    a keyframe, so a montage can be assembled from cached segments with a
+    stream copy and only segments whose inputs changed are encoded again.
+    """
+
+    SUFFIX = ".mp4"
+    SUBDIRECTORY = "segments"
+    VERSION = 1
+
+    def key(self, segment: Dict, photo_digests: List[str], fps: int, frame_size, encoder_settings) -> str:
+        """Cache key for a timeline segment
+
+        Covers the digests of the photos it shows, its length, and every
+        setting that changes the encoded bytes, but not its position in the
+        timeline.
+        """
+        if segment["type"] == "hold":
+            photos = (photo_digests[segment["photo"]],)
+        else:
+            photos = (photo_digests[segment["from"]], photo_digests[segment["to"]])
+        return settings_digest(segment["type"], photos, segment["frames"], fps,
+                               tuple(frame_size), encoder_settings, self.VERSION)
+
+
+class AudioCache(FileCache):
+    """Content-addressed LRU cache of music tracks prepared for muxing
+
+    Entries are AAC tracks keyed by the source track's content hash plus the
+    length and fade they were fitted to, so a track reused across montages
+    is transcoded once.
+    """
+
+    SUFFIX = ".m4a"
+    SUBDIRECTORY = "audio"
+    VERSION = 1
+
+    def key(self, music_path: str, duration: Optional[float], fade_seconds: float) -> str:
+        """Cache key for a track fitted to duration seconds (None for the whole track)"""
+        length = None if duration is None else round(duration, 6)
+        return settings_digest(file_digest(music_path), length, fade_seconds, self.VERSION)
+
+
+def store(path: str, array: np.ndarray):
+    """Write an array as .npy atomically so readers never see a partial file"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
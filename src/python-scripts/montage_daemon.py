@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Montage Daemon for Cench AI
+Long-running render service with a prioritized, bounded job queue
+"""
+
+import json
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from montage_generator import MontageGenerator
+from montage_progress import ProgressEvent, ProgressReporter
+
+# Lower runs first: previews someone is waiting on go ahead of batch finals
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class RenderJob:
+    """One montage request and everything known about it so far"""
+
+    def __init__(self, photo_paths: List[str], music_path: Optional[str], options: Dict, priority: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.photo_paths = photo_paths
+        self.music_path = music_path
+        self.options = options
+        self.priority = priority
+        self.state = "queued"
+        self.event = None
+        self.result = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def on_event(self, event: ProgressEvent):
+        self.event = event
+
+    def to_dict(self) -> Dict:
+        job = {
+            "id": self.id,
+            "state": self.state,
+            "priority": self.priority,
+            "photos": len(self.photo_paths),
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.event:
+            job["progress"] = {"stage": self.event.stage, "done": self.event.done, "total": self.event.total,
+                               "fraction": self.event.fraction, "eta_seconds": self.event.eta_seconds,
+                               "message": self.event.message}
+        if self.result is not None:
+            job["result"] = self.result
+        return job
+
+
+class RenderDaemon:
+    """Runs montage jobs from a priority queue, at most max_running at a time
+
+    Jobs of equal priority run in submission order. Submissions beyond
+    max_queued waiting jobs are refused rather than piling up, so a burst of
+    requests cannot overload the host. Finished jobs are kept for status
+    queries until max_history newer ones have finished.
+    """
+
+    def __init__(self, max_running: int = 1, max_queued: int = 32, max_history: int = 100,
+                 progress_rate: float = 2.0, **defaults):
+        self.max_running = max(1, max_running)
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.progress_rate = progress_rate
+        # MontageGenerator options applied to every job unless the job overrides them
+        self.defaults = defaults
+        self.queue = []
+        self.order = itertools.count()
+        self.jobs = {}
+        self.history = OrderedDict()
+        # Cache instances by cache_dir, shared by all jobs so their pins protect each other
+        self.caches = {}
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.workers = []
+
+    def start(self) -> "RenderDaemon":
+        for i in range(self.max_running):
+            worker = threading.Thread(target=self._work, name=f"montage-render-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    def stop(self, wait: bool = True):
+        """Stop taking jobs off the queue; running jobs finish"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def submit(self, photo_paths: List[str], music_path: Optional[str] = None,
+               priority: Optional[str] = None, **options) -> RenderJob:
+        """Queue a montage; priority defaults to interactive for drafts and batch otherwise"""
+        if not photo_paths:
+            raise ValueError("No photos provided")
+        if priority is None:
+            priority = "interactive" if options.get("profile") == "draft" else "batch"
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        job = RenderJob(list(photo_paths), music_path, dict(self.defaults, **options), priority)
+        with self.condition:
+            if self.stopping:
+                raise RuntimeError("Render daemon is stopping")
+            if len(self.queue) >= self.max_queued:
+                raise OverflowError(f"Render queue is full ({self.max_queued} jobs waiting)")
+            heapq.heappush(self.queue, (PRIORITIES[priority], next(self.order), job))
+            self.jobs[job.id] = job
+            self.condition.notify()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop a job that has not started yet"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.state != "queued":
+                return False
+            self.queue = [entry for entry in self.queue if entry[2] is not job]
+            heapq.heapify(self.queue)
+            job.state = "cancelled"
+            self._finished(job)
+        return True
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """State, progress and (once finished) result of a job"""
+        with self.condition:
+            job = self.jobs.get(job_id) or self.history.get(job_id)
+            if job is None:
+                return None
+            status = job.to_dict()
+            if job.state == "queued":
+                # Jobs that will start before this one
+                entry = next(entry for entry in self.queue if entry[2] is job)
+                status["position"] = sum(other[:2] < entry[:2] for other in self.queue)
+            return status
+
+    def list(self) -> List[Dict]:
+        """Running and queued jobs in the order they will finish, then recently finished ones"""
+        with self.condition:
+            running = [job for job in self.jobs.values() if job.state == "running"]
+            queued = [entry[2] for entry in sorted(self.queue)]
+            finished = list(reversed(self.history.values()))
+            return [job.to_dict() for job in running + queued + finished]
+
+    def stats(self) -> Dict:
+        with self.condition:
+            return {
+                "running": sum(job.state == "running" for job in self.jobs.values()),
+                "queued": len(self.queue),
+                "max_running": self.max_running,
+                "max_queued": self.max_queued,
+                "finished": len(self.history),
+            }
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                _, _, job = heapq.heappop(self.queue)
+                job.state = "running"
+                job.started = time.time()
+            self._run(job)
+
+    def _run(self, job: RenderJob):
+        reporter = ProgressReporter(job.on_event, self.progress_rate)
+        try:
+            generator = MontageGenerator(**job.options)
+            self.share_caches(generator)
+            result = generator.generate_montage(job.photo_paths, job.music_path, reporter)
+        except Exception as e:
+            result = {
+                "success": False,
+                "error": str(e),
+                "message": f"Failed to create montage: {e}"
+            }
+        with self.condition:
+            job.result = result
+            job.state = "done" if result.get("success") else "failed"
+            self._finished(job)
+
+    def share_caches(self, generator: MontageGenerator):
+        """Point a job's generator at the caches of earlier jobs using the same cache_dir
+
+        Jobs run as threads of one process; with separate instances one job's
+        eviction could delete entries another running job has pinned.
+        """
+        if not generator.canvas_cache:
+            return
+        with self.condition:
+            caches = self.caches.setdefault(
+                str(generator.canvas_cache.cache_dir.parent),
+                (generator.canvas_cache, generator.segment_cache, generator.audio_cache))
+        generator.canvas_cache, generator.segment_cache, generator.audio_cache = caches
+
+    def _finished(self, job: RenderJob):
+        """Move a job to the bounded history; call with the condition held"""
+        job.finished = time.time()
+        self.jobs.pop(job.id, None)
+        self.history[job.id] = job
+        while len(self.history) > self.max_history:
+            self.history.popitem(last=False)
+
+
+def serve_daemon(daemon: RenderDaemon, host: str = "127.0.0.1", port: int = 8766) -> ThreadingHTTPServer:
+    """Serve the render daemon over HTTP on the local machine
+
+    POST /jobs with {"photos": [...], "music": ..., "priority": ..., "options": {...}}
+    queues a montage (503 when the queue is full), GET /jobs lists jobs,
+    GET /jobs/ID returns one job's state and DELETE /jobs/ID cancels it
+    while queued. GET /stats reports queue occupancy. Call serve_forever()
+    on the returned server.
+    """
+    class DaemonHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body):
+            data = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def job_id(self) -> Optional[str]:
+            parts = self.path.strip("/").split("/")
+            return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+        def do_GET(self):
+            if self.path == "/jobs":
+                self.send_json(200, daemon.list())
+            elif self.path == "/stats":
+                self.send_json(200, daemon.stats())
+            elif self.job_id():
+                status = daemon.status(self.job_id())
+                if status:
+                    self.send_json(200, status)
+                else:
+                    self.send_error(404)
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                self.send_error(404)
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                job = daemon.submit(request.get("photos", []), request.get("music"),
+                                    request.get("priority"), **request.get("options", {}))
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {"success": False, "error": str(e)})
+                return
+            except (OverflowError, RuntimeError) as e:
+                self.send_json(503, {"success": False, "error": str(e)})
+                return
+            self.send_json(202, daemon.status(job.id))
+
+        def do_DELETE(self):
+            if not self.job_id():
+                self.send_error(404)
+                return
+            cancelled = daemon.cancel(self.job_id())
+            self.send_json(200 if cancelled else 409, {"success": cancelled})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), DaemonHandler)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Cench AI montage render daemon")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--max-running", type=int, default=1, help="montages rendered at once")
+    parser.add_argument("--max-queued", type=int, default=32, help="waiting jobs before submissions are refused")
+    args = parser.parse_args()
+
+    daemon = RenderDaemon(args.max_running, args.max_queued).start()
+    server = serve_daemon(daemon, port=args.port)
+    print(f"🎬 Montage render daemon on http://127.0.0.1:{server.server_address[1]} "
+          f"({args.max_running} at once, {args.max_queued} queued max)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        daemon.stop()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Montage Encoder for Cench AI
+Streams rendered montage frames into ffmpeg
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Length of progressive HLS fragments, in seconds
+HLS_FRAGMENT_SECONDS = 2
+# Audio that can be stream-copied into MP4 and HLS outputs as is
+COPY_AUDIO_CODECS = ("aac",)
+COPY_SAMPLE_RATES = (44100, 48000)
+
+_probes = {}
+
+
+def ffmpeg_available() -> bool:
+    """Check whether an ffmpeg binary is on the PATH"""
+    return shutil.which('ffmpeg') is not None
+
+
+def probe_media(media_path: str) -> Dict:
+    """Duration and first audio stream of a media file, read from ffmpeg's input summary
+
+    Results are memoized while the file is unchanged.
+    """
+    stat = os.stat(media_path)
+    memo_key = (os.path.abspath(media_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _probes:
+        return _probes[memo_key]
+
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', media_path],
+                            capture_output=True, text=True)
+    info = {"duration": None, "audio_codec": None, "sample_rate": None}
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = re.search(r'Audio: (\w+).*?(\d+) Hz', result.stderr)
+    if match:
+        info["audio_codec"] = match.group(1)
+        info["sample_rate"] = int(match.group(2))
+    _probes[memo_key] = info
+    return info
+
+
+def probe_duration(media_path: str) -> Optional[float]:
+    """Duration of a media file in seconds, or None if ffmpeg cannot tell"""
+    return probe_media(media_path)["duration"]
+
+
+def audio_copyable(music_path: str) -> bool:
+    """Whether a track's audio can be muxed without transcoding"""
+    info = probe_media(music_path)
+    return info["audio_codec"] in COPY_AUDIO_CODECS and info["sample_rate"] in COPY_SAMPLE_RATES
+
+
+def audio_codec_args(music_path: str) -> List[str]:
+    """ffmpeg audio codec arguments for muxing a music track: a stream copy when possible"""
+    return ['-c:a', 'copy'] if audio_copyable(music_path) else ['-c:a', 'aac']
+
+
+def fit_audio(music_path: str, duration: Optional[float], output_path: str, fade_seconds: float = 1.0) -> str:
+    """Transcode a music track to AAC in an MP4 file
+
+    With a duration, the track is looped or trimmed to exactly that many
+    seconds and faded out at the end.
+    """
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error']
+    if duration is not None:
+        fade = min(fade_seconds, duration / 2)
+        cmd += ['-stream_loop', '-1', '-i', music_path, '-t', f'{duration:.6f}',
+                '-af', f'afade=t=out:st={duration - fade:.6f}:d={fade:.6f}']
+    else:
+        cmd += ['-i', music_path]
+    cmd += ['-map', '0:a:0', '-vn', '-c:a', 'aac', '-f', 'mp4', output_path]
+    subprocess.run(cmd, check=True, capture_output=True)
+    return output_path
+
+
+def x264_args(preset: str = "medium", crf: int = 20, threads: int = 0) -> List[str]:
+    """ffmpeg output arguments for H.264 video playable everywhere"""
+    return [
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-crf', str(crf),
+        '-threads', str(threads),
+        '-pix_fmt', 'yuv420p',
+    ]
+
+
+def container_args(output_path: str) -> List[str]:
+    """ffmpeg output arguments for the container implied by the output path
+
+    An .m3u8 path is written as an event HLS playlist of fragmented MP4
+    segments next to it, finalized one by one while encoding runs, so
+    playback can start before the render finishes.
+    """
+    if not output_path.endswith('.m3u8'):
+        return []
+    base = os.path.splitext(output_path)[0]
+    return [
+        '-force_key_frames', f'expr:gte(t,n_forced*{HLS_FRAGMENT_SECONDS})',
+        '-f', 'hls',
+        '-hls_time', str(HLS_FRAGMENT_SECONDS),
+        '-hls_playlist_type', 'event',
+        '-hls_segment_type', 'fmp4',
+        '-hls_fmp4_init_filename', f'{os.path.basename(base)}_init.mp4',
+        '-hls_segment_filename', f'{base}_%05d.m4s',
+    ]
+
+
+def playlist_fragments(manifest_path: str) -> int:
+    """Number of fragments an HLS playlist lists as finalized"""
+    try:
+        with open(manifest_path) as f:
+            return sum(1 for line in f if line.startswith('#EXTINF'))
+    except FileNotFoundError:
+        return 0
+
+
+class PlaylistWatcher:
+    """Report the fragments of a growing HLS playlist while a render writes it"""
+
+    def __init__(self, manifest_path: str, callback, interval: float = 0.5):
+        self.manifest_path = manifest_path
+        self.callback = callback
+        self.interval = interval
+        self.fragments = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _poll(self):
+        fragments = playlist_fragments(self.manifest_path)
+        if fragments != self.fragments:
+            self.fragments = fragments
+            self.callback(self.manifest_path, fragments)
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            self._poll()
+
+    def stop(self) -> int:
+        """Stop watching and return the final fragment count"""
+        self.stopped.set()
+        self.thread.join()
+        self._poll()
+        return self.fragments
+
+
+def remux(source_path: str, output_path: str) -> str:
+    """Copy a finished video into the container its output path calls for"""
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-i', source_path, '-c', 'copy']
+    cmd += container_args(output_path)
+    cmd.append(output_path)
+    subprocess.run(cmd, check=True, capture_output=True)
+    return output_path
+
+
+def filter_script(graph: str) -> str:
+    """Write a filter graph to a temporary file for -filter_complex_script / -filter_script
+
+    Graphs and expressions grow with the photo count, and Linux caps a single
+    command-line argument at 128 KB, so they never go on the command line.
+    The caller removes the file once ffmpeg has exited.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.ffgraph', delete=False) as script:
+        script.write(graph)
+    return script.name
+
+
+def piecewise_expression(variable: str, pieces: List[Tuple[int, str]]) -> str:
+    """Build an ffmpeg expression that evaluates pieces[i][1] once variable >= pieces[i][0]
+
+    Pieces must be sorted by start. The pieces are arranged as a balanced
+    tree of if() calls, so evaluation is logarithmic in the piece count.
+    """
+    def build(lo: int, hi: int) -> str:
+        if hi - lo == 1:
+            return pieces[lo][1]
+        mid = (lo + hi) // 2
+        return f"if(lt({variable},{pieces[mid][0]}),{build(lo, mid)},{build(mid, hi)})"
+
+    return build(0, len(pieces))
+
+
+def hold_select_expression(segments: List[dict]) -> str:
+    """select filter expression that drops the repeated interior frames of holds
+
+    Frame n of a CFR render of the timeline is kept unless it lies strictly
+    inside a hold, so each hold is encoded as its first and last frame only.
+    """
+    pieces = []
+    for segment in segments:
+        start, frames = segment['start'], segment['frames']
+        if segment['type'] == 'hold' and frames > 2:
+            pieces.append((start, f"eq(n,{start})"))
+            pieces.append((start + frames - 1, "1"))
+        elif not pieces or pieces[-1][1] != "1":
+            pieces.append((start, "1"))
+    return piecewise_expression('n', pieces)
+
+
+def sent_frame_expression(segments: List[dict]) -> Tuple[str, int]:
+    """Map the index of a frame sent for a VFR timeline to its timeline frame
+
+    Holds are sent as one frame, plus a closing frame when the timeline ends
+    on a hold so its full duration is kept. Returns the expression and the
+    number of frames that have to be sent.
+    """
+    pieces = []
+    sent = 0
+    for segment in segments:
+        start, frames = segment['start'], segment['frames']
+        if segment['type'] == 'hold':
+            pieces.append((sent, str(start)))
+            sent += 1
+        else:
+            pieces.append((sent, f"{start}+N-{sent}"))
+            sent += frames
+
+    last = segments[-1]
+    if last['type'] == 'hold' and last['frames'] > 1:
+        pieces.append((sent, str(last['start'] + last['frames'] - 1)))
+        sent += 1
+
+    return piecewise_expression('N', pieces), sent
+
+
+class FFmpegPipeWriter:
+    """Drop-in replacement for cv2.VideoWriter that pipes raw frames to ffmpeg
+
+    Frames are encoded to H.264 and, when a music track is given, muxed with
+    the audio in the same pass, so the output path can be the final file.
+    With a frame_expression (see sent_frame_expression) the sent frames are
+    retimed onto the timeline and written as variable frame rate, so a hold
+    costs a single frame. -shortest cuts an unfitted track at the end of the
+    video; a track already fitted to the video needs shortest=False, since
+    -shortest would drop the last frame on AAC padding.
+    """
+
+    def __init__(self, output_path: str, fps: float, frame_size: Tuple[int, int],
+                 music_path: Optional[str] = None, preset: str = "medium",
+                 crf: int = 20, threads: int = 0, frame_expression: Optional[str] = None,
+                 container: Optional[str] = None, renditions: Optional[List[Tuple[str, Tuple[int, int]]]] = None,
+                 shortest: bool = True):
+        width, height = frame_size
+        self.output_path = output_path
+
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+            '-r', str(fps),
+            '-i', '-',
+        ]
+        if music_path:
+            cmd += ['-i', music_path]
+
+        # The retiming expression grows with the timeline, so filters go through a script file
+        retime = f"setpts='({frame_expression})/({fps}*TB)'" if frame_expression else None
+        self.script = None
+        if renditions:
+            # One set of frames feeds every rendition's scaler and encoder
+            chains, labels = split_renditions('timed', renditions)
+            self.script = filter_script(f"[0:v]{retime or 'null'}[timed];{chains}")
+            cmd += ['-filter_complex_script', self.script]
+            videos = [f'[{label}]' for label in labels]
+        else:
+            if retime:
+                self.script = filter_script(retime)
+                cmd += ['-filter_script:v', self.script]
+            videos = ['0:v:0']
+
+        paths = [output_path] + [path for path, _ in renditions or []]
+        for path, video in zip(paths, videos):
+            cmd += ['-map', video]
+            if music_path:
+                cmd += ['-map', '1:a:0', *audio_codec_args(music_path)] + (['-shortest'] if shortest else [])
+            if frame_expression:
+                cmd += ['-fps_mode', 'vfr']
+            cmd += x264_args(preset, crf, threads)
+            if container:
+                cmd += ['-f', container]
+            cmd += container_args(path)
+            cmd.append(path)
+
+        self.cmd = cmd
+        self.finished = False
+        try:
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError:
+            self.remove_script()
+            raise
+
+    def isOpened(self) -> bool:
+        """Mirror cv2.VideoWriter.isOpened"""
+        return self.process.poll() is None
+
+    def write(self, frame):
+        """Send one BGR frame to the encoder"""
+        if self.finished:
+            return
+        try:
+            self.process.stdin.write(memoryview(frame))
+        except BrokenPipeError:
+            # ffmpeg stops reading once -shortest ends the video with the music;
+            # release() raises with ffmpeg's error output if it failed instead
+            self.release()
+
+    def release(self):
+        """Finish encoding and wait for ffmpeg to exit"""
+        if self.finished:
+            return
+        self.finished = True
+        _, stderr = self.process.communicate()
+        self.remove_script()
+        if self.process.returncode != 0:
+            raise subprocess.CalledProcessError(self.process.returncode, self.cmd, stderr=stderr)
+
+    def abort(self):
+        """Stop ffmpeg after a failed render, without waiting for it to finish encoding"""
+        if self.finished:
+            return
+        self.finished = True
+        self.process.kill()
+        self.process.communicate()
+        self.remove_script()
+
+    def remove_script(self):
+        if self.script and os.path.exists(self.script):
+            os.unlink(self.script)
+
+
+def concat_segments(segment_paths: List[str], durations: List[float], output_path: str,
+                    music_path: Optional[str] = None, shortest: bool = True) -> str:
+    """Join encoded segments with a stream copy, muxing music in the same pass
+
+    Explicit durations keep segments that end on a long-held frame exactly
+    aligned on the timeline.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.ffconcat', delete=False) as listing:
+        listing.write("ffconcat version 1.0\n")
+        for path, duration in zip(segment_paths, durations):
+            escaped = path.replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\nduration {duration:.6f}\n")
+
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', listing.name]
+    if music_path:
+        cmd += ['-i', music_path]
+    cmd += ['-map', '0:v:0', '-c:v', 'copy']
+    if music_path:
+        cmd += ['-map', '1:a:0', *audio_codec_args(music_path)] + (['-shortest'] if shortest else [])
+    cmd += container_args(output_path)
+    cmd.append(output_path)
+
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+    finally:
+        os.unlink(listing.name)
+    return output_path
+
+
+def letterbox_filter(frame_size: Tuple[int, int]) -> str:
+    """ffmpeg filter that letterboxes like MontageGenerator.process_photos (no upscaling)"""
+    width, height = frame_size
+    return (
+        f"scale='min({width},iw)':'min({height},ih)':"
+        f"force_original_aspect_ratio=decrease:flags=lanczos,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1,format=yuv420p"
+    )
+
+
+def split_renditions(video_label: str, renditions: List[Tuple[str, Tuple[int, int]]]) -> Tuple[str, List[str]]:
+    """Filter graph chains that fan one video out to extra letterboxed rendition sizes
+
+    Returns the chains and the output labels; the first label is the video
+    at its original size, followed by one label per rendition.
+    """
+    count = len(renditions) + 1
+    chains = [f"[{video_label}]split={count}" + "".join(f"[split{i}]" for i in range(count))]
+    labels = ["split0"]
+    for i, (_, frame_size) in enumerate(renditions, start=1):
+        chains.append(f"[split{i}]{letterbox_filter(frame_size)}[rendition{i}]")
+        labels.append(f"rendition{i}")
+    return ";".join(chains), labels
+
+
+def transcode_renditions(source_path: str, renditions: List[Tuple[str, Tuple[int, int]]],
+                         preset: str = "medium", crf: int = 20, threads: int = 0) -> List[str]:
+    """Encode extra renditions of a finished montage, decoding it once"""
+    chains, labels = split_renditions('0:v', renditions)
+    # The unscaled branch of the split is not needed here
+    chains += f";[{labels[0]}]nullsink"
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-i', source_path, '-filter_complex', chains]
+    for (path, _), label in zip(renditions, labels[1:]):
+        cmd += ['-map', f'[{label}]', '-map', '0:a?', '-c:a', 'copy', '-fps_mode', 'passthrough']
+        cmd += x264_args(preset, crf, threads)
+        cmd += container_args(path)
+        cmd.append(path)
+    subprocess.run(cmd, check=True, capture_output=True)
+    return [path for path, _ in renditions]
+
+
+def build_crossfade_graph(segments: List[dict], photo_count: int, fps: int,
+                          frame_size: Tuple[int, int]) -> Tuple[str, str]:
+    """Build a filter graph that plays a montage timeline from photo inputs 0..N-1
+
+    Mirrors the frame loop: each photo is held for its hold segment, then
+    crossfades or cuts into the next. Each photo is decoded and scaled once, then
+    repeated with the loop filter. Returns the filter_complex string and the
+    label of the video output.
+    """
+    on_screen = [0] * photo_count
+    transitions = {}
+    for segment in segments:
+        if segment['type'] == 'hold':
+            on_screen[segment['photo']] += segment['frames']
+        else:
+            on_screen[segment['from']] += segment['frames']
+            on_screen[segment['to']] += segment['frames']
+            transitions[segment['to']] = segment
+
+    shown = [i for i, frames in enumerate(on_screen) if frames > 0]
+    chains = []
+    for i in shown:
+        chains.append(
+            f"[{i}:v]{letterbox_filter(frame_size)},"
+            f"loop=loop={on_screen[i] - 1}:size=1:start=0,setpts=N/{fps}/TB,fps={fps}:eof_action=pass[v{i}]"
+        )
+
+    previous = f"v{shown[0]}"
+    for i in shown[1:]:
+        label = f"x{i}"
+        transition = transitions.get(i)
+        if transition:
+            chains.append(
+                f"[{previous}][v{i}]xfade=transition=fade:"
+                f"duration={transition['frames'] / fps:.6f}:offset={transition['start'] / fps:.6f}[{label}]"
+            )
+        else:
+            # Cut straight to the next photo
+            chains.append(f"[{previous}][v{i}]concat=n=2:v=1:a=0[{label}]")
+        previous = label
+
+    return ";".join(chains), previous
+
+
+def render_crossfade_graph(photo_paths: List[str], output_path: str, fps: int,
+                           segments: List[dict], frame_size: Tuple[int, int],
+                           music_path: Optional[str] = None, preset: str = "medium",
+                           crf: int = 20, threads: int = 0, frame_progress=None,
+                           renditions: Optional[List[Tuple[str, Tuple[int, int]]]] = None,
+                           shortest: bool = True) -> str:
+    """Render a crossfade montage timeline entirely inside ffmpeg's filter graph
+
+    When the timeline contains holds, their repeated frames are dropped before
+    the encoder and the output is variable frame rate. Extra renditions are
+    scaled from the same rendered frames. frame_progress is called with the
+    number of timeline frames rendered so far.
+    """
+    filter_complex, video_label = build_crossfade_graph(segments, len(photo_paths), fps, frame_size)
+    total_frames = sum(segment['frames'] for segment in segments)
+
+    vfr = any(segment['type'] == 'hold' and segment['frames'] > 2 for segment in segments)
+    if vfr:
+        filter_complex += f";[{video_label}]select='{hold_select_expression(segments)}'[held]"
+        video_label = "held"
+
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1']
+    for photo_path in photo_paths:
+        cmd += ['-i', photo_path]
+    if music_path:
+        cmd += ['-i', music_path]
+
+    labels = [video_label]
+    if renditions:
+        chains, labels = split_renditions(video_label, renditions)
+        filter_complex += f";{chains}"
+
+    script = filter_script(filter_complex)
+    cmd += ['-filter_complex_script', script]
+    paths = [output_path] + [path for path, _ in renditions or []]
+    for path, label in zip(paths, labels):
+        cmd += ['-map', f'[{label}]']
+        cmd += ['-fps_mode', 'vfr'] if vfr else ['-r', str(fps)]
+        if music_path:
+            cmd += ['-map', f'{len(photo_paths)}:a:0', *audio_codec_args(music_path)]
+            cmd += ['-shortest'] if shortest else []
+        cmd += x264_args(preset, crf, threads)
+        cmd += container_args(path)
+        cmd.append(path)
+
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if frame_progress and key == 'out_time_us' and value.isdigit():
+                frame_progress(min(total_frames, int(int(value) / 1e6 * fps)))
+
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+    finally:
+        os.unlink(script)
+    return output_path
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Montage Estimate for Cench AI
+Predicts a montage's render time, peak memory and output size before it starts
+"""
+
+import os
+import copy
+import json
+import time
+import shutil
+import platform
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from montage_cache import DEFAULT_CACHE_DIR
+from montage_encoder import FFmpegPipeWriter, ffmpeg_available, probe_duration
+from montage_generator import CrossfadeKernel, MontageGenerator, peak_rss_mb, prepare_canvas
+
+DEFAULT_CALIBRATION_PATH = DEFAULT_CACHE_DIR.parent / "calibration.json"
+CALIBRATION_VERSION = 1
+
+# Rough constants for an uncalibrated machine; times are seconds, sizes bytes
+DEFAULT_CONSTANTS = {
+    "overhead_seconds": 1.0,
+    "decode_seconds_per_megapixel": 0.03,
+    "draft_decode_seconds_per_megapixel": 0.01,
+    "blend_seconds_per_megapixel_frame": 0.004,
+    "encode_seconds_per_megapixel_frame": {"ultrafast": 0.002, "veryfast": 0.006, "medium": 0.02},
+    "bytes_per_megapixel_frame": {"ultrafast": 40000, "veryfast": 25000, "medium": 20000},
+    "base_rss_mb": 120.0,
+}
+
+# Size of the calibration render; constants are scaled per megapixel
+CALIBRATION_PHOTO_SIZE = (3000, 2000)
+CALIBRATION_FRAME_SIZE = (1280, 720)
+CALIBRATION_FRAMES = 24
+AUDIO_BYTES_PER_SECOND = 128000 / 8
+
+
+def machine_id() -> Dict:
+    """What a calibration is only valid for"""
+    return {"node": platform.node(), "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def calibrate(path: str = str(DEFAULT_CALIBRATION_PATH), presets=("ultrafast", "veryfast", "medium")) -> Dict:
+    """Time a short run of each pipeline stage on this machine and store the constants"""
+    work_dir = tempfile.mkdtemp(prefix="cench_calibrate_")
+    try:
+        rng = np.random.default_rng(1234)
+        width, height = CALIBRATION_PHOTO_SIZE
+        base = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+        photo_path = os.path.join(work_dir, "photo.jpg")
+        Image.fromarray(base).resize((width, height), Image.Resampling.BICUBIC).save(photo_path, quality=90)
+        source_mp = width * height / 1e6
+        frame_mp = CALIBRATION_FRAME_SIZE[0] * CALIBRATION_FRAME_SIZE[1] / 1e6
+
+        constants = copy.deepcopy(DEFAULT_CONSTANTS)
+        start = time.perf_counter()
+        canvas = prepare_canvas(photo_path, CALIBRATION_FRAME_SIZE)
+        constants["decode_seconds_per_megapixel"] = (time.perf_counter() - start) / source_mp
+        start = time.perf_counter()
+        prepare_canvas(photo_path, CALIBRATION_FRAME_SIZE, draft=True)
+        constants["draft_decode_seconds_per_megapixel"] = (time.perf_counter() - start) / source_mp
+
+        kernel = CrossfadeKernel(CALIBRATION_FRAME_SIZE)
+        other = np.ascontiguousarray(canvas[::-1])
+        frames = []
+        start = time.perf_counter()
+        for batch in kernel.render(canvas, other, CALIBRATION_FRAMES):
+            frames.extend(frame.copy() for frame in batch)
+        constants["blend_seconds_per_megapixel_frame"] = (time.perf_counter() - start) / (CALIBRATION_FRAMES * frame_mp)
+        kernel.close()
+
+        if ffmpeg_available():
+            for preset in presets:
+                output_path = os.path.join(work_dir, f"{preset}.mp4")
+                start = time.perf_counter()
+                out = FFmpegPipeWriter(output_path, 30, CALIBRATION_FRAME_SIZE, preset=preset)
+                for frame in frames:
+                    out.write(frame)
+                out.release()
+                megapixel_frames = CALIBRATION_FRAMES * frame_mp
+                constants["encode_seconds_per_megapixel_frame"][preset] = (time.perf_counter() - start) / megapixel_frames
+                constants["bytes_per_megapixel_frame"][preset] = os.path.getsize(output_path) / megapixel_frames
+
+        constants["base_rss_mb"] = peak_rss_mb() or constants["base_rss_mb"]
+        calibration = {"version": CALIBRATION_VERSION, "machine": machine_id(),
+                       "created": time.time(), "constants": constants}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(calibration, f, indent=2)
+        return calibration
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def load_calibration(path: str = str(DEFAULT_CALIBRATION_PATH)) -> Optional[Dict]:
+    """Stored calibration constants, or None if there are none for this machine"""
+    try:
+        with open(path) as f:
+            calibration = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if calibration.get("version") != CALIBRATION_VERSION or calibration.get("machine") != machine_id():
+        return None
+    return calibration
+
+
+def preset_constant(table: Dict, preset: str) -> float:
+    """Per-preset constant, falling back to the nearest calibrated preset"""
+    return table.get(preset, table.get("medium", next(iter(table.values()))))
+
+
+def estimate(generator: MontageGenerator, photo_paths: List[str], music_path: Optional[str] = None,
+             calibration: Optional[Dict] = None) -> Dict:
+    """Predict wall time, peak memory and output size of generator.generate_montage
+
+    Photos are only opened for their headers. Without a calibration for this
+    machine the default constants give an order of magnitude.
+    """
+    constants = (calibration or {}).get("constants", DEFAULT_CONSTANTS)
+
+    sizes = []
+    for photo_path in photo_paths:
+        try:
+            with Image.open(photo_path) as img:
+                sizes.append(img.size)
+        except Exception as e:
+            print(f"Error processing {photo_path}: {e}")
+    source_mps = [width * height / 1e6 for width, height in sizes]
+
+    # Lay the timeline out exactly as the render will, without touching the generator
+    planner = copy.copy(generator)
+    music_duration = probe_duration(music_path) if music_path and ffmpeg_available() else None
+    if music_duration:
+        segments = planner.fit_timeline(photo_paths[:len(sizes)], music_duration)
+    else:
+        segments = planner.timeline_segments(len(sizes))
+    total_frames = sum(segment["frames"] for segment in segments)
+    blended_frames = sum(segment["frames"] for segment in segments if segment["type"] == "transition")
+    holds = [segment for segment in segments if segment["type"] == "hold"]
+    # The ffmpeg pipe and filter graph send a hold as a single frame; the OpenCV
+    # writer sends all of them (and its mp4v encode is costed like x264)
+    single_frame_holds = generator.encoder == "ffmpeg" or generator.supports_filtergraph(len(sizes))
+    encoded_frames = blended_frames + (len(holds) if single_frame_holds else sum(s["frames"] for s in holds))
+
+    width, height = generator.frame_size
+    frame_mp = width * height / 1e6
+    output_mp = frame_mp + sum(w * h / 1e6 for w, h in
+                               (size for _, size in generator.rendition_targets("montage.mp4").values()
+                                if tuple(size) != tuple(generator.frame_size)))
+    preset = generator.x264_preset
+
+    decode_rate = constants["draft_decode_seconds_per_megapixel" if generator.draft
+                            else "decode_seconds_per_megapixel"]
+    decode_seconds = sum(source_mps) * decode_rate / max(1, generator.workers)
+    blend_seconds = blended_frames * frame_mp * constants["blend_seconds_per_megapixel_frame"]
+    encode_seconds = encoded_frames * output_mp * preset_constant(
+        constants["encode_seconds_per_megapixel_frame"], preset)
+    wall_seconds = constants["overhead_seconds"] + decode_seconds + blend_seconds + encode_seconds
+
+    canvas_mb = frame_mp * 3
+    # The largest decoded source per worker, the canvases being blended and the kernel's frames
+    working_mb = max(source_mps, default=0) * 3 * max(1, generator.workers) + (2 + CrossfadeKernel.BATCH_SIZE) * canvas_mb
+    if generator.in_memory and not generator.streaming:
+        resident = len(sizes) * canvas_mb
+        if generator.resident_budget_mb is not None:
+            resident = min(resident, generator.resident_budget_mb)
+        working_mb += resident
+    duration = total_frames / generator.fps
+    output_bytes = encoded_frames * output_mp * preset_constant(constants["bytes_per_megapixel_frame"], preset)
+    if music_path:
+        output_bytes += duration * AUDIO_BYTES_PER_SECOND
+
+    return {
+        "wall_seconds": round(wall_seconds, 2),
+        "stages": {"decode": round(decode_seconds, 2), "blend": round(blend_seconds, 2),
+                   "encode": round(encode_seconds, 2)},
+        "peak_rss_mb": round(constants["base_rss_mb"] + working_mb, 1),
+        "output_bytes": int(output_bytes),
+        "duration": duration,
+        "frames": total_frames,
+        "photos": len(sizes),
+        "source_megapixels": round(sum(source_mps), 1),
+        "calibrated": calibration is not None,
+    }
+
+
+def estimate_montage(photo_paths: List[str], music_path: Optional[str] = None,
+                     calibration_path: str = str(DEFAULT_CALIBRATION_PATH), **options) -> Dict:
+    """Estimate the cost of create_montage with the same arguments, using this machine's calibration"""
+    return estimate(MontageGenerator(**options), photo_paths, music_path, load_calibration(calibration_path))
+
+
+if __name__ == "__main__":
+    print("⏱️  Calibrating montage cost estimates...")
+    calibration = calibrate()
+    print(json.dumps(calibration, indent=2))
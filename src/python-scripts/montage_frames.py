@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Montage Frames for Cench AI
+Random-access preview frames of a montage timeline, for scrubbing and thumbnails
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from montage_generator import MontageGenerator
+from montage_timeline import TimelineEvaluator, spec_photos
+
+
+class LRUCache:
+    """Small thread-safe least recently used mapping"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class FrameServer:
+    """Render any instant of a montage timeline without rendering the video
+
+    A frame costs at most two canvases and one blend. Decoded canvases and
+    encoded JPEG frames are kept in LRU caches, so scrubbing back and forth
+    and thumbnail strips stay interactive on long montages. Canvases go
+    through the generator's photo pipeline, so its canvas cache and render
+    profile apply. The timeline is a timeline spec or a list of photos laid
+    out with the generator's settings.
+    """
+
+    def __init__(self, timeline: Union[List[str], Dict], generator: Optional[MontageGenerator] = None,
+                 transition_duration: float = 1.0, canvas_cache_size: int = 8, frame_cache_size: int = 128):
+        self.generator = generator or MontageGenerator(profile="draft")
+        if not isinstance(timeline, dict):
+            timeline = self.generator.timeline_spec(timeline, transition_duration=transition_duration)
+        self.photo_paths = spec_photos(timeline)
+        self.fps = self.generator.fps
+        self.timeline = TimelineEvaluator(timeline, self.fps, self.canvas)
+        self.canvases = LRUCache(canvas_cache_size)
+        self.frames = LRUCache(frame_cache_size)
+
+    @property
+    def duration(self) -> float:
+        return self.timeline.duration
+
+    def canvas(self, index: int) -> np.ndarray:
+        """Letterboxed canvas of one photo, black if it cannot be decoded"""
+        canvas = self.canvases.get(index)
+        if canvas is None:
+            try:
+                canvas = self.generator.load_photo_canvas(index, self.photo_paths[index])
+            except Exception as e:
+                print(f"Error processing {self.photo_paths[index]}: {e}")
+            if canvas is None:
+                width, height = self.generator.frame_size
+                canvas = np.zeros((height, width, 3), dtype=np.uint8)
+            self.canvases.put(index, canvas)
+        return canvas
+
+    def frame(self, seconds: float) -> np.ndarray:
+        """BGR frame of the montage at a timestamp"""
+        return self.timeline.frame(self.timeline.frame_index(seconds))
+
+    def jpeg(self, seconds: float, width: Optional[int] = None, quality: int = 85) -> bytes:
+        """JPEG of the montage at a timestamp, optionally scaled down to a thumbnail width"""
+        key = (self.timeline.frame_index(seconds), width, quality)
+        data = self.frames.get(key)
+        if data is None:
+            frame = self.frame(seconds)
+            if width and width < frame.shape[1]:
+                height = round(frame.shape[0] * width / frame.shape[1])
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise ValueError("Could not encode frame")
+            data = encoded.tobytes()
+            self.frames.put(key, data)
+        return data
+
+    def thumbnails(self, count: int, width: int = 160) -> List[bytes]:
+        """Evenly spaced thumbnail JPEGs across the montage"""
+        return [self.jpeg(self.duration * (i + 0.5) / count, width) for i in range(count)]
+
+    def info(self) -> Dict:
+        """Timeline layout and cache counters"""
+        return {
+            "duration": self.duration,
+            "fps": self.fps,
+            "frame_size": list(self.generator.frame_size),
+            "segments": self.timeline.segments,
+            "canvas_cache": {"hits": self.canvases.hits, "misses": self.canvases.misses},
+            "frame_cache": {"hits": self.frames.hits, "misses": self.frames.misses},
+        }
+
+
+def serve_frames(frame_server: FrameServer, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Serve preview frames over HTTP on the local machine
+
+    GET /frame?t=SECONDS[&width=PIXELS] returns a JPEG, GET /timeline the
+    timeline as JSON. Call serve_forever() on the returned server.
+    """
+    class FrameHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                if url.path == "/frame":
+                    width = int(query["width"][0]) if "width" in query else None
+                    body = frame_server.jpeg(float(query.get("t", ["0"])[0]), width)
+                    content_type = "image/jpeg"
+                elif url.path == "/timeline":
+                    body = json.dumps(frame_server.info()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), FrameHandler)
+
+
+if __name__ == "__main__":
+    import sys
+    server = serve_frames(FrameServer(sys.argv[1:]))
+    print(f"🎞️  Serving montage frames on http://127.0.0.1:{server.server_address[1]}")
+    server.serve_forever()
@@ -5,8 +5,11 @@ Creates video montages from photos with music
 """
 
 import os
+import io
 import sys
+import copy
 import json
+import queue
 import tempfile
 import shutil
 from pathlib import Path
@@ -14,6 +17,14 @@ from typing import List, Dict, Optional
 import subprocess
 import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from functools import partial
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 try:
     import cv2
@@ -26,115 +37,1014 @@ except ImportError:
     import numpy as np
     from PIL import Image, ImageDraw, ImageFont
 
+# Local modules need the packages above, so they are imported once those are installed
+from montage_cache import AudioCache, CanvasCache, SegmentCache, file_digest, settings_digest, store
+from montage_library import MontageLibrary
+from montage_store import CanvasStore, fill_slot
+from montage_progress import as_progress
+from montage_trace import NULL_TRACER, Tracer, traced_call
+from montage_timeline import (fit_spec_to_duration, spec_fingerprint, spec_photos, spec_segments,
+                              timeline_spec, truncate_segments, validate_spec)
+from montage_encoder import (FFmpegPipeWriter, PlaylistWatcher, audio_codec_args, audio_copyable,
+                             concat_segments, container_args, ffmpeg_available, fit_audio, playlist_fragments,
+                             probe_duration, remux, render_crossfade_graph, sent_frame_expression,
+                             transcode_renditions)
+
+TARGET_SIZE = (1920, 1080)
+
+# Output settings per render profile; every profile renders the same timeline
+RENDER_PROFILES = {
+    "final": {"frame_size": TARGET_SIZE, "fps": 30, "draft": False},
+    "draft": {"frame_size": (854, 480), "fps": 12, "draft": True,
+              "x264_preset": "ultrafast", "x264_crf": 30},
+}
+
+# Named output renditions; extra renditions are scaled from the same rendered frames
+RENDITIONS = {
+    "1080p": (1920, 1080),
+    "720p": (1280, 720),
+    "vertical": (1080, 1920),
+}
+
+# Most photos the filter graph backend renders: ffmpeg opens and decodes every
+# input at once (tens of MB each for camera photos), so longer montages use
+# the frame loop, whose memory does not grow with the photo count
+FILTERGRAPH_MAX_PHOTOS = 32
+
+# Bump when a change to the renderers changes the montages they produce
+RENDER_VERSION = 1
+
+# Montage renders in progress in this process, by request fingerprint
+_renders = {}
+_renders_lock = threading.Lock()
+
+
+def resolve_workers(workers: Optional[int]) -> int:
+    """Turn a worker setting into a process count (0 or None = one per CPU)"""
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def letterbox_photo(photo_path: str, target_size=TARGET_SIZE, draft: bool = False) -> Image.Image:
+    """Resize a photo onto a black canvas of the target size
+    
+    Draft quality lets the JPEG decoder downscale straight to the target size
+    and resamples bilinearly, for previews.
+    """
+    # Load and resize image
+    img = Image.open(photo_path)
+    
+    # Resize to target size maintaining aspect ratio
+    if draft:
+        img.thumbnail(target_size, Image.Resampling.BILINEAR, reducing_gap=1.0)
+    else:
+        img.thumbnail(target_size, Image.Resampling.LANCZOS)
+    
+    # Create new image with black background
+    new_img = Image.new('RGB', target_size, (0, 0, 0))
+    
+    # Center the image
+    x = (target_size[0] - img.size[0]) // 2
+    y = (target_size[1] - img.size[1]) // 2
+    new_img.paste(img, (x, y))
+    return new_img
+
+
+def prepare_photo(photo_path: str, processed_path: str, target_size=TARGET_SIZE, draft: bool = False) -> str:
+    """Letterbox a photo and save it as JPEG"""
+    letterbox_photo(photo_path, target_size, draft).save(processed_path, "JPEG", quality=95)
+    return processed_path
+
+
+def prepare_canvas(photo_path: str, target_size=TARGET_SIZE, draft: bool = False) -> np.ndarray:
+    """Letterbox a photo and return it as a BGR canvas ready for OpenCV"""
+    return cv2.cvtColor(np.asarray(letterbox_photo(photo_path, target_size, draft)), cv2.COLOR_RGB2BGR)
+
+
+def decode_canvas(photo_path: str, data: Optional[bytes], target_size=TARGET_SIZE,
+                  draft: bool = False) -> Optional[np.ndarray]:
+    """Letterbox photo bytes that were already read from disk into a BGR canvas"""
+    if data is None:
+        return None
+    try:
+        return prepare_canvas(io.BytesIO(data), target_size, draft)
+    except Exception as e:
+        print(f"Error processing {photo_path}: {e}")
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process in MB, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def prepare_cached_canvas(photo_path: str, cache_path: str, target_size=TARGET_SIZE,
+                          in_memory: bool = False, draft: bool = False):
+    """Letterbox a photo into the canvas cache and return the canvas or its cache path"""
+    canvas = prepare_canvas(photo_path, target_size, draft)
+    store(cache_path, canvas)
+    return canvas if in_memory else cache_path
+
+
+def prepare_spilled_canvas(photo_path: str, location, slab_shape, target_size=TARGET_SIZE,
+                           draft: bool = False):
+    """Letterbox a photo straight into a reserved CanvasStore slot"""
+    return fill_slot(location, slab_shape, prepare_canvas(photo_path, target_size, draft))
+
+
+def cached_canvas(cache_path: str, in_memory: bool = False):
+    """Resolve a canvas cache hit to the canvas itself or its cache path"""
+    return load_canvas(cache_path) if in_memory else cache_path
+
+
+def load_canvas(photo) -> Optional[np.ndarray]:
+    """Return a BGR canvas for a processed photo path, cached canvas or in-memory canvas"""
+    if isinstance(photo, np.ndarray):
+        return photo
+    if photo.endswith('.npy'):
+        try:
+            return np.load(photo, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+    return cv2.imread(photo)
+
+
+def build_timeline(photo_count: int, transition_frames: int, hold_frames: int = 0) -> List[Dict]:
+    """Lay out the hold and transition segments of a montage, in frames
+    
+    Each photo is held for hold_frames and then crossfades into the next one
+    over transition_frames. Segment starts are timeline frame indexes.
+    """
+    segments = []
+    start = 0
+    
+    for i in range(photo_count):
+        if hold_frames > 0:
+            segments.append({"type": "hold", "photo": i, "start": start, "frames": hold_frames})
+            start += hold_frames
+        if i < photo_count - 1 and transition_frames > 0:
+            segments.append({"type": "transition", "from": i, "to": i + 1,
+                             "start": start, "frames": transition_frames})
+            start += transition_frames
+    
+    return segments
+
+
+def segment_photos(segment: Dict) -> List[int]:
+    """Indexes of the photos a timeline segment shows"""
+    if segment["type"] == "hold":
+        return [segment["photo"]]
+    return [segment["from"], segment["to"]]
+
+
+class CrossfadeKernel:
+    """Batched crossfade renderer that fills preallocated frame buffers
+    
+    Allocating a fresh 6MB array per frame costs more than the blend itself, so
+    frames are written into a small reused batch. Each horizontal band of the
+    two photos is blended for every frame of the batch while it is still in
+    cache, and bands can be spread over threads since OpenCV releases the GIL.
+    Output is identical to calling cv2.addWeighted once per frame.
+    """
+    
+    BAND_ROWS = 64
+    BATCH_SIZE = 4
+    
+    def __init__(self, frame_size=TARGET_SIZE, batch_size: int = BATCH_SIZE, threads: int = 1):
+        width, height = frame_size
+        self.batch_size = max(1, batch_size)
+        self.frames = np.empty((self.batch_size, height, width, 3), dtype=np.uint8)
+        self.bands = [slice(y, min(y + self.BAND_ROWS, height)) for y in range(0, height, self.BAND_ROWS)]
+        self.pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    
+    def close(self):
+        """Stop the band worker threads"""
+        if self.pool:
+            self.pool.shutdown()
+    
+    def render(self, img1: np.ndarray, img2: np.ndarray, transition_frames: int):
+        """Yield batches of crossfade frames for alpha = k / transition_frames
+        
+        Each batch is a view into a reused buffer and is only valid until the
+        next one is requested.
+        """
+        for start in range(0, transition_frames, self.batch_size):
+            alphas = [k / transition_frames for k in range(start, min(start + self.batch_size, transition_frames))]
+            
+            def render_band(band):
+                band1, band2 = img1[band], img2[band]
+                for k, alpha in enumerate(alphas):
+                    cv2.addWeighted(band1, 1.0 - alpha, band2, alpha, 0, dst=self.frames[k, band])
+            
+            if self.pool:
+                list(self.pool.map(render_band, self.bands))
+            else:
+                for band in self.bands:
+                    render_band(band)
+            
+            yield self.frames[:len(alphas)]
+
+
+class CanvasStream:
+    """Ordered stream of photo canvases fed by bounded read and decode stages
+    
+    A reader thread loads file bytes at most read_depth photos ahead, and at
+    most decode_depth canvases are being decoded or waiting at any time, so
+    memory stays flat however many photos the montage has. Photos that fail
+    to decode come out as None.
+    """
+    
+    def __init__(self, photo_paths: List[str], read_depth: int = 4, decode_depth: int = 4,
+                 workers: int = 1, target_size=TARGET_SIZE, draft: bool = False, tracer=NULL_TRACER):
+        self.photo_paths = photo_paths
+        self.read_queue = queue.Queue(maxsize=max(1, read_depth))
+        self.decode_depth = max(1, decode_depth)
+        self.workers = workers
+        self.target_size = target_size
+        self.draft = draft
+        self.tracer = tracer
+        self.stopped = threading.Event()
+    
+    def _read(self):
+        for photo_path in self.photo_paths:
+            try:
+                with self.tracer.span("read_photo", path=photo_path), open(photo_path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                print(f"Error processing {photo_path}: {e}")
+                data = None
+            if not self._put((photo_path, data)):
+                return
+        self._put(None)
+    
+    def _put(self, item) -> bool:
+        # Block while the queue is full, but give up once the consumer stops
+        while not self.stopped.is_set():
+            try:
+                self.read_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def __iter__(self):
+        reader = threading.Thread(target=self._read, daemon=True)
+        reader.start()
+        pending = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                exhausted = False
+                while True:
+                    while not exhausted and len(pending) < self.decode_depth:
+                        item = self.read_queue.get()
+                        if item is None:
+                            exhausted = True
+                        else:
+                            pending.append(pool.submit(self._decode, *item))
+                    if not pending:
+                        return
+                    yield pending.popleft().result()
+        finally:
+            self.stopped.set()
+            for future in pending:
+                future.cancel()
+    
+    def _decode(self, photo_path: str, data: Optional[bytes]) -> Optional[np.ndarray]:
+        with self.tracer.span("decode_photo", path=photo_path):
+            return decode_canvas(photo_path, data, self.target_size, self.draft)
+
+
+def write_segment(out, segment: Dict, images: List[np.ndarray], kernel: CrossfadeKernel,
+                  single_frame_holds: bool = False, advance=None):
+    """Write the frames of one timeline segment to a video writer"""
+    if segment["type"] == "hold":
+        # With VFR timestamps a hold is a single frame
+        for _ in range(1 if single_frame_holds else segment["frames"]):
+            out.write(images[0])
+        if advance:
+            advance(segment["frames"])
+        return
+    
+    # Create crossfade transition
+    for batch in kernel.render(images[0], images[1], segment["frames"]):
+        for blended in batch:
+            out.write(blended)
+        if advance:
+            advance(len(batch))
+
+
+def abort_writer(out):
+    """Close a video writer whose render failed, leaving no ffmpeg process or filter script behind"""
+    if isinstance(out, FFmpegPipeWriter):
+        out.abort()
+    else:
+        out.release()
+
+
+def split_timeline(segments: List[Dict], chunk_count: int) -> List[Dict]:
+    """Split a timeline into contiguous chunks of roughly equal length
+    
+    Each chunk is a self-contained timeline starting at frame 0 whose photo
+    indexes refer to its own "photos" list of original indexes.
+    """
+    total_frames = sum(segment["frames"] for segment in segments)
+    chunk_count = max(1, min(chunk_count, len(segments)))
+    chunks = []
+    current = []
+    for segment in segments:
+        current.append(segment)
+        # Cut once the chunk reaches its share of the timeline
+        if (len(chunks) < chunk_count - 1
+                and segment["start"] + segment["frames"] >= total_frames * (len(chunks) + 1) / chunk_count):
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    
+    timelines = []
+    for chunk in chunks:
+        photos = sorted({i for segment in chunk for i in segment_photos(segment)})
+        local = {photo: i for i, photo in enumerate(photos)}
+        offset = chunk[0]["start"]
+        timeline = []
+        for segment in chunk:
+            segment = dict(segment, start=segment["start"] - offset)
+            for field in ("photo", "from", "to"):
+                if field in segment:
+                    segment[field] = local[segment[field]]
+            timeline.append(segment)
+        timelines.append({
+            "segments": timeline,
+            "photos": photos,
+            "frames": sum(segment["frames"] for segment in chunk),
+        })
+    return timelines
+
+
+def render_timeline_file(segments: List[Dict], canvases: List, output_path: str, fps: int,
+                         frame_size=TARGET_SIZE, preset: str = "medium", crf: int = 20,
+                         threads: int = 0, advance=None) -> str:
+    """Encode a timeline starting at frame 0 as a self-contained H.264 file
+    
+    Runs in render worker processes; canvases may be arrays or canvas files.
+    """
+    frame_expression = None
+    if any(segment["type"] == "hold" and segment["frames"] > 1 for segment in segments):
+        frame_expression, _ = sent_frame_expression(segments)
+    
+    out = FFmpegPipeWriter(output_path, fps, frame_size, preset=preset, crf=crf, threads=threads,
+                           frame_expression=frame_expression, container="mp4")
+    kernel = CrossfadeKernel(frame_size)
+    loaded = {}
+    try:
+        for segment in segments:
+            indexes = segment_photos(segment)
+            for i in indexes:
+                if i not in loaded:
+                    loaded = {k: v for k, v in loaded.items() if k >= i - 1}
+                    loaded[i] = load_canvas(canvases[i])
+            images = [loaded[i] for i in indexes]
+            write_segment(out, segment, images, kernel, bool(frame_expression), advance)
+        
+        if frame_expression and segments[-1]["type"] == "hold" and segments[-1]["frames"] > 1:
+            # Closing frame so the final hold keeps its full duration
+            out.write(images[0])
+        out.release()
+    except BaseException:
+        abort_writer(out)
+        raise
+    finally:
+        kernel.close()
+    return output_path
+
+
 class MontageGenerator:
-    def __init__(self):
+    def __init__(self, workers: int = 1, in_memory: bool = False, encoder: str = "opencv",
+                 x264_preset: str = "medium", x264_crf: int = 20, encoder_threads: int = 0,
+                 backend: str = "auto", hold_duration: float = 0.0,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 2 * 1024 ** 3,
+                 render_workers: int = 1, streaming: bool = False, queue_depth: int = 4,
+                 memory_limit_mb: Optional[int] = None, resident_budget_mb: Optional[float] = None,
+                 profile: str = "final", renditions: Optional[List] = None, output_format: str = "mp4",
+                 music_fit: str = "shortest", reuse_outputs: bool = True,
+                 library_budget_mb: Optional[float] = None, output_dir: Optional[str] = None,
+                 trace: bool = False, progress_rate: float = 10.0):
         self.temp_dir = None
-        self.output_dir = Path.home() / "Documents" / "Cench AI Montages"
-        self.output_dir.mkdir(exist_ok=True)
+        self.output_dir = Path(output_dir) if output_dir else Path.home() / "Documents" / "Cench AI Montages"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Number of processes used to preprocess photos (1 = serial, 0 = one per CPU)
+        self.workers = resolve_workers(workers)
+        # Hand decoded canvases to the renderer instead of writing JPEGs to disk;
+        # with a resident budget, canvases beyond it spill to memory-mapped scratch files
+        self.in_memory = in_memory or resident_budget_mb is not None
+        self.resident_budget_mb = resident_budget_mb
+        self.canvas_store = None
+        # "opencv" writes mp4v then remuxes; "ffmpeg" pipes frames to libx264 in one pass
+        self.encoder = encoder
+        self.x264_preset = x264_preset
+        self.x264_crf = x264_crf
+        self.base_encoder_settings = (x264_preset, x264_crf)
+        self.encoder_threads = encoder_threads
+        # "auto" renders plain crossfades in an ffmpeg filter graph when possible
+        # (up to FILTERGRAPH_MAX_PHOTOS photos),
+        # "frames" always uses the Python frame loop
+        self.backend = backend
+        # Output size, frame rate and decode quality ("final" or "draft", see RENDER_PROFILES)
+        self.apply_profile(profile)
+        # "mp4" writes one file; "hls" writes a growing fragmented-MP4 playlist
+        # that can be played while the render is still running
+        self.output_format = output_format
+        # Timeline spec being rendered, when the montage was described by one
+        self.timeline = None
+        # How the timeline and music are matched up: "shortest" stops the video
+        # with the music, "holds" stretches holds to the music, "loop" keeps the
+        # timeline and loops or trims the music; the music fades out at the end
+        self.music_fit = music_fit
+        self.music_fade = 1.0
+        self.frame_limit = None
+        # Photos whose headers were already read during the current render
+        self.verified_photos = None
+        # Music being prepared for muxing on a background thread while frames render
+        self.audio_job = None
+        # Extra outputs: RENDITIONS names or (name, (width, height)) pairs
+        self.renditions = list(renditions or [])
+        self.pending_renditions = []
+        # Return the saved output of an identical earlier request instead of rendering again
+        self.reuse_outputs = reuse_outputs
+        # Disk budget of the output library; least recently used montages beyond it are deleted
+        self.library_budget_mb = library_budget_mb
+        # Write a Chrome trace of every render stage next to the output
+        self.trace = trace
+        self.tracer = NULL_TRACER
+        # Maximum progress events per second; stage changes always get through
+        self.progress_rate = progress_rate
+        # Seconds each photo stays on screen between crossfades
+        self.hold_duration = hold_duration
+        # Processes encoding timeline chunks in parallel (1 = in process, 0 = one per CPU)
+        self.render_workers = resolve_workers(render_workers)
+        # Stream photos through bounded read/decode/blend stages instead of
+        # processing them all up front; memory_limit_mb caps the canvases in flight
+        self.streaming = streaming
+        self.queue_depth = queue_depth
+        self.memory_limit_mb = memory_limit_mb
+        # Persistent caches of letterboxed canvases and encoded timeline segments
+        self.canvas_cache = None
+        self.segment_cache = None
+        self.audio_cache = None
+        if cache_dir:
+            self.canvas_cache = CanvasCache(os.path.join(cache_dir, "canvases"), cache_max_bytes)
+            self.segment_cache = SegmentCache(os.path.join(cache_dir, "segments"), cache_max_bytes)
+            self.audio_cache = AudioCache(os.path.join(cache_dir, "audio"), cache_max_bytes)
+        
+    def apply_profile(self, profile: str):
+        """Switch to a render profile's output size, frame rate and encoder settings"""
+        if profile not in RENDER_PROFILES:
+            raise ValueError(f"Unknown render profile: {profile}")
+        settings = RENDER_PROFILES[profile]
+        self.profile = profile
+        self.frame_size = settings["frame_size"]
+        self.fps = settings["fps"]
+        self.draft = settings["draft"]
+        self.x264_preset = settings.get("x264_preset", self.base_encoder_settings[0])
+        self.x264_crf = settings.get("x264_crf", self.base_encoder_settings[1])
+    
+    def with_profile(self, profile: str) -> "MontageGenerator":
+        """Copy of this generator rendering with another profile, sharing its caches"""
+        generator = copy.copy(self)
+        generator.apply_profile(profile)
+        return generator
+    
+    def timeline_spec(self, photo_paths: List[str], music_path: Optional[str] = None,
+                      transition_duration: float = 1.0) -> Dict:
+        """Timeline spec of a montage of these photos with this generator's settings"""
+        return timeline_spec(photo_paths, self.hold_duration, transition_duration, music_path)
+    
+    def timeline_segments(self, photo_count: int, transition_duration: float = 1.0,
+                          hold_duration: Optional[float] = None) -> List[Dict]:
+        """Segments to render, from the timeline spec when it covers these photos"""
+        if self.timeline and photo_count == len(self.timeline["items"]):
+            segments = spec_segments(self.timeline, self.fps)
+        else:
+            hold_duration = self.hold_duration if hold_duration is None else hold_duration
+            segments = build_timeline(photo_count, int(self.fps * transition_duration),
+                                      int(round(self.fps * hold_duration)))
+        if self.frame_limit is not None:
+            # Never render frames past the end of the music
+            segments = truncate_segments(segments, self.frame_limit)
+        return segments
+    
+    def plan_music(self, photo_paths: List[str], music_path: str, progress_callback=None):
+        """Match the timeline and the music track up before anything is rendered
+        
+        Only the probe runs up front: the track is fitted to the planned video
+        length on a background thread (see music_track). If the track cannot
+        be probed, it is muxed as is and cut with the video.
+        """
+        with self.tracer.span("probe_music", path=music_path):
+            music_duration = probe_duration(music_path)
+        if not music_duration:
+            return
+        as_progress(progress_callback)("Fitting timeline to music...")
+        
+        video_frames = sum(segment["frames"] for segment in self.fit_timeline(photo_paths, music_duration))
+        if not video_frames:
+            return
+        video_duration = video_frames / self.fps
+        # Within a frame of the video, the track plays out whole and -shortest
+        # cuts nothing audible, so it needs neither a trim nor a fade
+        duration = None if abs(music_duration - video_duration) <= 1 / self.fps else video_duration
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.audio_job = executor.submit(self.prepare_music, music_path, duration)
+        executor.shutdown(wait=False)
+    
+    def fit_timeline(self, photo_paths: List[str], music_duration: float) -> List[Dict]:
+        """Lay the timeline out against music_duration seconds of music, following music_fit"""
+        if self.music_fit == "holds":
+            spec = self.timeline
+            if not spec or len(spec["items"]) != len(photo_paths):
+                spec = self.timeline_spec(photo_paths)
+            self.timeline = fit_spec_to_duration(spec, music_duration)
+        elif self.music_fit == "shortest":
+            self.frame_limit = int(music_duration * self.fps)
+        elif self.music_fit != "loop":
+            raise ValueError(f"Unknown music fit: {self.music_fit}")
+        return self.timeline_segments(len(photo_paths))
+    
+    def prepare_music(self, music_path: str, duration: Optional[float]) -> str:
+        """Fit a track to duration seconds (None keeps it whole) as muxable AAC, through the audio cache"""
+        with self.tracer.span("prepare_music", path=music_path, duration=duration):
+            return self._prepare_music(music_path, duration)
+    
+    def _prepare_music(self, music_path: str, duration: Optional[float]) -> str:
+        if duration is None and audio_copyable(music_path):
+            return music_path
+        if self.audio_cache is None:
+            return fit_audio(music_path, duration, os.path.join(self.temp_dir, "music.m4a"), self.music_fade)
         
+        key = self.audio_cache.key(music_path, duration, self.music_fade)
+        cached = self.audio_cache.lookup(key)
+        if cached:
+            return cached
+        entry = self.audio_cache.path(key)
+        temp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fit_audio(music_path, duration, temp_path, self.music_fade)
+        os.replace(temp_path, entry)
+        self.audio_cache.added(entry)
+        return entry
+    
+    def cut_music(self) -> bool:
+        """Whether the mux has to cut the music at the end of the video (it was not fitted to it)"""
+        return self.audio_job is None
+    
+    def music_track(self, music_path: Optional[str]) -> Optional[str]:
+        """Music to mux, waiting for the background preparation if it is still running"""
+        if music_path is None or self.audio_job is None:
+            return music_path
+        try:
+            with self.tracer.span("wait_music"):
+                return self.audio_job.result()
+        except Exception as e:
+            print(f"Error preparing music: {e}")
+            return music_path
+    
+    def silent_outputs(self, output_path: str, music_path: Optional[str], renditions=None):
+        """Where to encode so the render does not wait for the music being prepared
+        
+        While the track is fitted on a background thread, the video and its
+        renditions are encoded without sound into the temp directory and
+        mux_music adds the track with a stream copy once they are done. HLS
+        playlists keep the music inline so fragments play during the render.
+        Returns the path and renditions to encode and the (silent, final)
+        pairs to mux, which are empty when the music can be encoded inline.
+        """
+        if not music_path or self.audio_job is None or output_path.endswith('.m3u8'):
+            return output_path, renditions, []
+        muxes = [(os.path.join(self.temp_dir, f"silent_{os.path.basename(path)}"), path)
+                 for path in [output_path] + [path for path, _ in renditions or []]]
+        if renditions:
+            renditions = [(silent_path, size) for (silent_path, _), (_, size) in zip(muxes[1:], renditions)]
+        return muxes[0][0], renditions, muxes
+    
+    def mux_music(self, muxes: List[tuple], music_path: str, progress_callback=None):
+        """Add the music to the outputs silent_outputs redirected, keeping them silent if that fails"""
+        for silent_path, output_path in muxes:
+            if self.add_music(silent_path, music_path, output_path, progress_callback) != output_path:
+                shutil.copy2(silent_path, output_path)
+    
     def create_temp_directory(self):
         """Create temporary directory for processing"""
         self.temp_dir = tempfile.mkdtemp(prefix="cench_montage_")
+        if self.resident_budget_mb is not None:
+            self.canvas_store = CanvasStore(self.temp_dir, self.frame_size, self.resident_budget_mb)
         return self.temp_dir
     
     def cleanup_temp_directory(self):
         """Clean up temporary files"""
+        if self.canvas_store:
+            self.canvas_store.close()
+            self.canvas_store = None
         if self.temp_dir and os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir)
     
-    def process_photos(self, photo_paths: List[str], progress_callback=None) -> List[str]:
-        """Process and resize photos for montage"""
-        processed_photos = []
+    def process_photos(self, photo_paths: List[str], progress_callback=None,
+                       workers: Optional[int] = None, in_memory: Optional[bool] = None) -> List:
+        """Process and resize photos for montage
         
-        for i, photo_path in enumerate(photo_paths):
-            if progress_callback:
-                progress_callback(f"Processing photo {i+1}/{len(photo_paths)}")
-            
+        Returns processed JPEG paths, or BGR numpy canvases in in-memory mode.
+        With a canvas cache, cached photos skip decoding entirely and disk mode
+        returns .npy cache paths that the renderer memory-maps.
+        """
+        with self.tracer.span("process_photos", photos=len(photo_paths)):
+            processed = self.process_photo_map(photo_paths, progress_callback, workers, in_memory)
+        return [processed[i] for i in sorted(processed)]
+    
+    def process_photo_map(self, photo_paths: List[str], progress_callback=None,
+                          workers: Optional[int] = None, in_memory: Optional[bool] = None,
+                          indexes: Optional[List[int]] = None) -> Dict[int, object]:
+        """Process the photos at the given indexes (default all), keyed by index
+        
+        Photos that fail to process are reported and left out.
+        """
+        workers = self.workers if workers is None else resolve_workers(workers)
+        in_memory = self.in_memory if in_memory is None else in_memory
+        indexes = list(range(len(photo_paths))) if indexes is None else indexes
+        progress = as_progress(progress_callback)
+        progress.start("decode", total=len(indexes))
+        if workers > 1 and len(indexes) > 1:
+            return self._process_photos_parallel(photo_paths, indexes, workers, in_memory, progress)
+        
+        processed_photos = {}
+        
+        for i in indexes:
+            photo_path = photo_paths[i]
             try:
-                # Load and resize image
-                img = Image.open(photo_path)
-                
-                # Resize to 1920x1080 maintaining aspect ratio
-                target_size = (1920, 1080)
-                img.thumbnail(target_size, Image.Resampling.LANCZOS)
-                
-                # Create new image with black background
-                new_img = Image.new('RGB', target_size, (0, 0, 0))
-                
-                # Center the image
-                x = (target_size[0] - img.size[0]) // 2
-                y = (target_size[1] - img.size[1]) // 2
-                new_img.paste(img, (x, y))
-                
-                # Save processed image
-                processed_path = os.path.join(self.temp_dir, f"processed_{i:03d}.jpg")
-                new_img.save(processed_path, "JPEG", quality=95)
-                processed_photos.append(processed_path)
+                task, args = self._photo_task(i, photo_path, in_memory)
+                with self.tracer.span("decode_photo", index=i, path=photo_path, task=task.__name__):
+                    processed = task(*args)
+                if processed is None:
+                    raise ValueError("cached canvas is unreadable")
+                processed_photos[i] = self._photo_done(task, args, processed)
                 
             except Exception as e:
                 print(f"Error processing {photo_path}: {e}")
-                continue
+            finally:
+                progress.advance()
         
         return processed_photos
     
-    def create_transitions(self, photo_paths: List[str], transition_duration: float = 1.0, progress_callback=None) -> str:
-        """Create smooth transitions between photos"""
-        if len(photo_paths) < 2:
-            return photo_paths[0] if photo_paths else None
+    def _photo_task(self, index: int, photo_path: str, in_memory: bool):
+        """Pick the preprocessing function and arguments for one photo"""
+        if self.canvas_cache:
+            key = self.canvas_cache.key(photo_path, self.frame_size, "draft" if self.draft else "lanczos")
+            cached_path = self.canvas_cache.lookup(key)
+            if cached_path:
+                return cached_canvas, (cached_path, in_memory)
+            return prepare_cached_canvas, (photo_path, self.canvas_cache.path(key), self.frame_size,
+                                           in_memory, self.draft)
+        if in_memory:
+            location = self.canvas_store.reserve() if self.canvas_store else None
+            if location:
+                return prepare_spilled_canvas, (photo_path, location, self.canvas_store.slab_shape,
+                                                self.frame_size, self.draft)
+            return prepare_canvas, (photo_path, self.frame_size, self.draft)
+        processed_path = os.path.join(self.temp_dir, f"processed_{index:03d}.jpg")
+        return prepare_photo, (photo_path, processed_path, self.frame_size, self.draft)
+    
+    def _photo_done(self, task, args, result):
+        """Account for a finished task and turn its result into a canvas or canvas path"""
+        if task is prepare_cached_canvas:
+            self.canvas_cache.added(args[1])
+        if task is prepare_spilled_canvas:
+            return self.canvas_store.view(result)
+        return result
+    
+    def load_photo_canvas(self, index: int, photo_path: str) -> Optional[np.ndarray]:
+        """Decode a single photo to a canvas, through the canvas cache when there is one"""
+        task, args = self._photo_task(index, photo_path, True)
+        return load_canvas(self._photo_done(task, args, task(*args)))
+    
+    def _process_photos_parallel(self, photo_paths: List[str], indexes: List[int], workers: int,
+                                 in_memory: bool, progress_callback=None) -> Dict[int, object]:
+        """Process photos in a process pool, keyed by their input index"""
+        results = {}
+        progress = as_progress(progress_callback)
         
-        fps = 30
-        transition_frames = int(fps * transition_duration)
+        with ProcessPoolExecutor(max_workers=min(workers, len(indexes))) as pool:
+            futures = {}
+            for i in indexes:
+                photo_path = photo_paths[i]
+                try:
+                    task, args = self._photo_task(i, photo_path, in_memory)
+                    if task is cached_canvas:
+                        # Cache hits are cheap enough to resolve here
+                        with self.tracer.span("decode_photo", index=i, path=photo_path, task=task.__name__):
+                            results[i] = task(*args)
+                        progress.advance()
+                    elif self.tracer.enabled:
+                        futures[pool.submit(traced_call, task, *args)] = (i, task, args)
+                    else:
+                        futures[pool.submit(task, *args)] = (i, task, args)
+                except Exception as e:
+                    print(f"Error processing {photo_path}: {e}")
+                    progress.advance()
+            
+            for future in as_completed(futures):
+                progress.advance()
+                
+                i, task, args = futures[future]
+                try:
+                    result = future.result()
+                    if self.tracer.enabled:
+                        result = self.tracer.add_call("decode_photo", result, index=i, path=photo_paths[i],
+                                                      task=task.__name__)
+                    results[i] = self._photo_done(task, args, result)
+                except Exception as e:
+                    print(f"Error processing {photo_paths[i]}: {e}")
         
-        # Create video writer
-        output_path = os.path.join(self.temp_dir, "montage_with_transitions.mp4")
+        return {i: result for i, result in results.items() if result is not None}
+    
+    def use_ffmpeg_encoder(self) -> bool:
+        """Whether frames should be piped straight to ffmpeg"""
+        if self.encoder != "ffmpeg":
+            return False
+        if not ffmpeg_available():
+            print("ffmpeg not found. Falling back to OpenCV encoder.")
+            self.encoder = "opencv"
+            return False
+        return True
+    
+    def open_video_writer(self, output_path: str, fps: float, frame_size=TARGET_SIZE,
+                          music_path: Optional[str] = None, frame_expression: Optional[str] = None,
+                          renditions: Optional[List] = None):
+        """Open the frame writer for the configured encoder"""
+        if self.use_ffmpeg_encoder():
+            return FFmpegPipeWriter(output_path, fps, frame_size, music_path=music_path,
+                                    preset=self.x264_preset, crf=self.x264_crf,
+                                    threads=self.encoder_threads, frame_expression=frame_expression,
+                                    renditions=renditions, shortest=self.cut_music())
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (1920, 1080))
+        return cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+    
+    def create_transitions(self, photo_paths: List, transition_duration: float = 1.0, progress_callback=None,
+                           output_path: Optional[str] = None, music_path: Optional[str] = None,
+                           hold_duration: Optional[float] = None) -> str:
+        """Create smooth transitions between photos
         
-        total_frames = len(photo_paths) * transition_frames
-        current_frame = 0
+        Accepts processed photo paths or in-memory BGR canvases; each photo is
+        decoded once. With the ffmpeg encoder, music is muxed into output_path
+        (see silent_outputs) and every hold is encoded as a single frame.
+        """
+        fps = self.fps
+        segments = self.timeline_segments(len(photo_paths), transition_duration, hold_duration)
         
-        for i in range(len(photo_paths) - 1):
-            img1 = cv2.imread(photo_paths[i])
-            img2 = cv2.imread(photo_paths[i + 1])
-            
-            if img1 is None or img2 is None:
-                continue
-            
-            # Create crossfade transition
-            for frame in range(transition_frames):
-                alpha = frame / transition_frames
-                beta = 1.0 - alpha
+        if not segments:
+            # A single photo without hold time has nothing to animate
+            if photo_paths and isinstance(photo_paths[0], np.ndarray):
+                still_path = os.path.join(self.temp_dir, "processed_000.jpg")
+                cv2.imwrite(still_path, photo_paths[0])
+                return still_path
+            return photo_paths[0] if photo_paths else None
+        
+        # Create video writer
+        final_output = output_path is not None
+        if output_path is None:
+            output_path = os.path.join(self.temp_dir, "montage_with_transitions.mp4")
+        frame_expression = None
+        if self.use_ffmpeg_encoder() and any(s["type"] == "hold" and s["frames"] > 1 for s in segments):
+            frame_expression, _ = sent_frame_expression(segments)
+        # Renditions are encoded alongside the final output in the single-pass mode
+        renditions = self.pending_renditions if final_output and self.use_ffmpeg_encoder() else None
+        encode_path, encode_renditions, muxes = self.silent_outputs(output_path, music_path, renditions)
+        out = self.open_video_writer(encode_path, fps, self.frame_size, None if muxes else self.music_track(music_path),
+                                     frame_expression, encode_renditions)
+        
+        progress = as_progress(progress_callback)
+        progress.start("render", total=sum(segment["frames"] for segment in segments))
+        kernel = CrossfadeKernel(self.frame_size, threads=self.workers)
+        canvases = {}
+        
+        def canvas(i):
+            # Keep only the canvases of the current pair in memory
+            if i not in canvases:
+                for old in [k for k in canvases if k < i - 1]:
+                    del canvases[old]
+                canvases[i] = load_canvas(photo_paths[i])
+            return canvases[i]
+        
+        try:
+            for segment in segments:
+                images = [canvas(i) for i in segment_photos(segment)]
                 
-                # Blend images
-                blended = cv2.addWeighted(img1, beta, img2, alpha, 0)
-                out.write(blended)
+                if any(img is None for img in images):
+                    if not frame_expression:
+                        continue
+                    # Keep the sent frames aligned with their VFR timestamps
+                    images = [np.zeros_like(kernel.frames[0]) if img is None else img for img in images]
                 
-                current_frame += 1
-                if progress_callback:
-                    progress = int((current_frame / total_frames) * 100)
-                    progress_callback(f"Creating transitions: {progress}%")
+                with self.tracer.span("render_segment", type=segment["type"], first_frame=segment["start"],
+                                      frames=segment["frames"]):
+                    write_segment(out, segment, images, kernel, bool(frame_expression), progress.advance)
+            
+            if frame_expression and segments[-1]["type"] == "hold":
+                # Closing frame so the final hold keeps its full duration
+                out.write(images[0])
+            
+            with self.tracer.span("finish_encode", path=output_path):
+                out.release()
+        except BaseException:
+            abort_writer(out)
+            raise
+        finally:
+            kernel.close()
+        self.mux_music(muxes, music_path, progress_callback)
+        if renditions:
+            self.pending_renditions = []
+        return output_path
+    
+    def render_timeline_files(self, jobs: List[Dict], progress_callback=None):
+        """Encode timeline chunks to files, in render worker processes when configured
         
-        out.release()
+        Each job has "segments", "canvases", "path" and "frames" entries.
+        """
+        fps = self.fps
+        progress = as_progress(progress_callback)
+        progress.start("render", total=sum(job["frames"] for job in jobs))
+        
+        workers = min(self.render_workers, len(jobs))
+        # Share the cores between the parallel encoders instead of oversubscribing them
+        threads = self.encoder_threads or (max(1, (os.cpu_count() or 1) // workers) if workers > 1 else 0)
+        options = dict(frame_size=self.frame_size, preset=self.x264_preset, crf=self.x264_crf, threads=threads)
+        
+        if workers <= 1:
+            for job in jobs:
+                with self.tracer.span("encode_segments", path=job["path"], segments=len(job["segments"]),
+                                      frames=job["frames"]):
+                    render_timeline_file(job["segments"], job["canvases"], job["path"], fps,
+                                         advance=progress.advance, **options)
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for job in jobs:
+                args = (partial(render_timeline_file, **options), job["segments"], job["canvases"], job["path"], fps)
+                futures[pool.submit(traced_call, *args) if self.tracer.enabled else pool.submit(*args)] = job
+            for future in as_completed(futures):
+                job = futures[future]
+                result = future.result()
+                if self.tracer.enabled:
+                    self.tracer.add_call("encode_segments", result, path=job["path"],
+                                         segments=len(job["segments"]), frames=job["frames"])
+                progress.advance(job["frames"])
+    
+    def renders_plain_crossfades(self) -> bool:
+        """Whether frames can be rendered outside the frame loop (no subclass effects)"""
+        # Subclasses that apply their own effects need the frame loop
+        return type(self).add_effects is MontageGenerator.add_effects
+    
+    def render_segments_montage(self, photo_paths: List[str], output_path: str,
+                                music_path: Optional[str] = None, progress_callback=None,
+                                transition_duration: float = 1.0) -> bool:
+        """Assemble the montage from cached segment encodes with a stream copy
+        
+        Only segments whose photos or settings changed since an earlier render
+        are decoded and encoded. Returns False when the segment cache does not
+        apply and another backend has to render the montage.
+        """
+        if not self.segment_cache or not self.renders_plain_crossfades() or not ffmpeg_available():
+            return False
+        
+        fps = self.fps
+        encoder_settings = ("libx264", self.x264_preset, self.x264_crf, "yuv420p")
+        
+        photos, digests = [], []
+        for photo_path in photo_paths:
+            try:
+                digests.append(file_digest(photo_path))
+                photos.append(photo_path)
+            except OSError as e:
+                print(f"Error processing {photo_path}: {e}")
+        
+        while True:
+            segments = self.timeline_segments(len(photos), transition_duration)
+            if not segments:
+                return False
+            
+            keys = [self.segment_cache.key(segment, digests, fps, self.frame_size, encoder_settings)
+                    for segment in segments]
+            segment_paths = [self.segment_cache.lookup(key) for key in keys]
+            needed = sorted({i for segment, path in zip(segments, segment_paths) if path is None
+                             for i in segment_photos(segment)})
+            
+            # Worker processes read canvases from disk rather than unpickling them
+            in_memory = self.in_memory and self.render_workers <= 1
+            canvases = self.process_photo_map(photos, progress_callback, in_memory=in_memory, indexes=needed)
+            failed = set(needed) - set(canvases)
+            if not failed:
+                break
+            # Drop photos that cannot be decoded and lay the timeline out again
+            photos = [p for i, p in enumerate(photos) if i not in failed]
+            digests = [d for i, d in enumerate(digests) if i not in failed]
+        
+        missing = [n for n, path in enumerate(segment_paths) if path is None]
+        jobs = []
+        for n in missing:
+            chunk = split_timeline([segments[n]], 1)[0]
+            path = self.segment_cache.path(keys[n])
+            jobs.append(dict(chunk, canvases=[canvases[i] for i in chunk["photos"]],
+                             path=f"{path}.{os.getpid()}.{threading.get_ident()}.part", entry=path))
+        
+        try:
+            self.render_timeline_files(jobs, progress_callback)
+            for n, job in zip(missing, jobs):
+                os.replace(job["path"], job["entry"])
+                self.segment_cache.added(job["entry"])
+                segment_paths[n] = job["entry"]
+        finally:
+            for job in jobs:
+                if os.path.exists(job["path"]):
+                    os.remove(job["path"])
+        
+        as_progress(progress_callback).start(
+            "mux", message=f"Joining {len(segments)} segments ({len(missing)} re-rendered)...")
+        music_path = self.music_track(music_path)
+        with self.tracer.span("concat", segments=len(segments), music=music_path):
+            concat_segments(segment_paths, [segment["frames"] / fps for segment in segments],
+                            output_path, music_path, shortest=self.cut_music())
+        return True
+    
+    def supports_filtergraph(self, photo_count: int) -> bool:
+        """Whether this montage can be rendered without touching pixels in Python"""
+        # Drafts decode JPEGs at reduced size, which beats full decodes in ffmpeg
+        if self.backend == "frames" or self.draft or not 2 <= photo_count <= FILTERGRAPH_MAX_PHOTOS:
+            return False
+        return self.renders_plain_crossfades() and ffmpeg_available()
+    
+    def readable_photos(self, photo_paths: List[str], progress_callback=None) -> List[str]:
+        """Keep only photos whose headers can be read, without decoding them"""
+        readable = []
+        progress = as_progress(progress_callback)
+        progress.start("decode", total=len(photo_paths))
+        
+        for photo_path in photo_paths:
+            progress.advance()
+            if self.verified_photos is not None and photo_path in self.verified_photos:
+                readable.append(photo_path)
+                continue
+            try:
+                with self.tracer.span("verify_photo", path=photo_path), Image.open(photo_path) as img:
+                    img.verify()
+                readable.append(photo_path)
+                if self.verified_photos is not None:
+                    self.verified_photos.add(photo_path)
+            except Exception as e:
+                print(f"Error processing {photo_path}: {e}")
+                continue
+        
+        return readable
+    
+    def create_transitions_filtergraph(self, photo_paths: List[str], output_path: str,
+                                       transition_duration: float = 1.0, music_path: Optional[str] = None,
+                                       progress_callback=None) -> str:
+        """Render crossfades between original photos in a single ffmpeg filter graph"""
+        fps = self.fps
+        segments = self.timeline_segments(len(photo_paths), transition_duration)
+        encode_path, renditions, muxes = self.silent_outputs(output_path, music_path, self.pending_renditions)
+        progress = as_progress(progress_callback)
+        progress.start("render", total=sum(segment["frames"] for segment in segments))
+        with self.tracer.span("render_filtergraph", photos=len(photo_paths), segments=len(segments),
+                              renditions=len(self.pending_renditions)):
+            render_crossfade_graph(
+                photo_paths, encode_path, fps, segments, self.frame_size,
+                music_path=None if muxes else self.music_track(music_path), preset=self.x264_preset,
+                crf=self.x264_crf, threads=self.encoder_threads, frame_progress=progress.update,
+                renditions=renditions, shortest=self.cut_music())
+        self.mux_music(muxes, music_path, progress_callback)
         return output_path
     
     def add_music(self, video_path: str, music_path: str, output_path: str, progress_callback=None) -> str:
         """Add music to the montage video"""
-        if progress_callback:
-            progress_callback("Adding music to montage...")
+        as_progress(progress_callback).start("mux", message="Adding music to montage...")
         
         try:
             # Use ffmpeg to add music
+            music_path = self.music_track(music_path)
+            span = self.tracer.span("mux_music", path=music_path)
             cmd = [
                 'ffmpeg', '-y',
                 '-i', video_path,
                 '-i', music_path,
                 '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-shortest',
+                *audio_codec_args(music_path),
+                *(['-shortest'] if self.cut_music() else []),
+                *container_args(output_path),
                 output_path
             ]
             
-            subprocess.run(cmd, check=True, capture_output=True)
+            with span:
+                subprocess.run(cmd, check=True, capture_output=True)
             return output_path
             
         except subprocess.CalledProcessError as e:
@@ -147,29 +1057,161 @@ class MontageGenerator:
     
     def add_effects(self, video_path: str, progress_callback=None) -> str:
         """Add visual effects to the montage"""
-        if progress_callback:
-            progress_callback("Adding visual effects...")
+        as_progress(progress_callback)("Adding visual effects...")
         
         # For now, return the original video
         # This can be extended with more effects
         return video_path
     
-    def generate_montage(self, photo_paths: List[str], music_path: Optional[str] = None, 
-                        progress_callback=None) -> Dict[str, str]:
-        """Generate complete montage from photos and music"""
+    def render_chunked_montage(self, photo_paths: List[str], output_path: str,
+                               music_path: Optional[str] = None, progress_callback=None,
+                               transition_duration: float = 1.0) -> bool:
+        """Render timeline chunks in parallel worker processes and join them losslessly
+        
+        Returns False when parallel rendering does not apply.
+        """
+        if self.render_workers <= 1 or not self.renders_plain_crossfades() or not ffmpeg_available():
+            return False
+        
+        fps = self.fps
+        canvases = self.process_photos(photo_paths, progress_callback, in_memory=False)
+        segments = self.timeline_segments(len(canvases), transition_duration)
+        if len(segments) < 2:
+            return False
+        
+        chunks = split_timeline(segments, self.render_workers)
+        jobs = [dict(chunk, canvases=[canvases[i] for i in chunk["photos"]],
+                     path=os.path.join(self.temp_dir, f"chunk_{n:03d}.mp4"))
+                for n, chunk in enumerate(chunks)]
+        self.render_timeline_files(jobs, progress_callback)
+        
+        as_progress(progress_callback).start("mux", message=f"Joining {len(jobs)} chunks...")
+        music_path = self.music_track(music_path)
+        with self.tracer.span("concat", segments=len(jobs), music=music_path):
+            concat_segments([job["path"] for job in jobs], [job["frames"] / fps for job in jobs],
+                            output_path, music_path, shortest=self.cut_music())
+        return True
+    
+    def stream_decode_depth(self) -> int:
+        """Canvases the streaming pipeline may decode ahead within the memory ceiling"""
+        if not self.memory_limit_mb:
+            return self.queue_depth
+        width, height = self.frame_size
+        canvas_mb = width * height * 3 / (1024 * 1024)
+        # The blend stage holds a pair of canvases plus the kernel's frame batch
+        resident = 2 + CrossfadeKernel.BATCH_SIZE
+        budget = int(self.memory_limit_mb / canvas_mb) - resident
+        if budget < 1:
+            print(f"Memory limit of {self.memory_limit_mb} MB is below the pipeline minimum, decoding one photo ahead")
+        return max(1, min(self.queue_depth, budget))
+    
+    def render_streaming_montage(self, photo_paths: List[str], output_path: str,
+                                 music_path: Optional[str] = None, progress_callback=None,
+                                 transition_duration: float = 1.0) -> bool:
+        """Render the montage as a pipeline of bounded read, decode, blend and encode stages
+        
+        The encoder is the ffmpeg process on the other end of a pipe, whose
+        buffer bounds the last stage. Returns False when streaming does not apply.
+        """
+        if not self.streaming or not self.renders_plain_crossfades() or not ffmpeg_available():
+            return False
+        
+        fps = self.fps
+        photos = self.readable_photos(photo_paths, progress_callback)
+        segments = self.timeline_segments(len(photos), transition_duration)
+        if not segments:
+            return False
+        
+        frame_expression = None
+        if any(segment["type"] == "hold" and segment["frames"] > 1 for segment in segments):
+            frame_expression, _ = sent_frame_expression(segments)
+        encode_path, renditions, muxes = self.silent_outputs(output_path, music_path, self.pending_renditions)
+        out = FFmpegPipeWriter(encode_path, fps, self.frame_size,
+                               music_path=None if muxes else self.music_track(music_path),
+                               preset=self.x264_preset, crf=self.x264_crf,
+                               threads=self.encoder_threads, frame_expression=frame_expression,
+                               renditions=renditions, shortest=self.cut_music())
+        
+        progress = as_progress(progress_callback)
+        progress.start("render", total=sum(segment["frames"] for segment in segments))
+        
+        stream = iter(CanvasStream(photos, self.queue_depth, self.stream_decode_depth(), self.workers,
+                                   self.frame_size, self.draft, self.tracer))
+        kernel = CrossfadeKernel(self.frame_size, threads=self.workers)
+        canvases = {}
+        
+        def canvas(i):
+            while i not in canvases:
+                for old in [k for k in canvases if k < i - 1]:
+                    del canvases[old]
+                canvases[len(canvases) and max(canvases) + 1] = next(stream)
+            return canvases[i]
+        
         try:
-            # Create temp directory
-            self.create_temp_directory()
-            
-            if progress_callback:
-                progress_callback("Starting montage generation...")
-            
-            # Process photos
-            processed_photos = self.process_photos(photo_paths, progress_callback)
-            
-            if not processed_photos:
-                raise Exception("No photos were processed successfully")
+            for segment in segments:
+                images = [canvas(i) for i in segment_photos(segment)]
+                if any(img is None for img in images):
+                    if not frame_expression:
+                        continue
+                    # Keep the sent frames aligned with their VFR timestamps
+                    images = [np.zeros_like(kernel.frames[0]) if img is None else img for img in images]
+                with self.tracer.span("render_segment", type=segment["type"], first_frame=segment["start"],
+                                      frames=segment["frames"]):
+                    write_segment(out, segment, images, kernel, bool(frame_expression), progress.advance)
             
+            if frame_expression and segments[-1]["type"] == "hold":
+                # Closing frame so the final hold keeps its full duration
+                out.write(images[0])
+            with self.tracer.span("finish_encode", path=output_path):
+                out.release()
+        except BaseException:
+            abort_writer(out)
+            raise
+        finally:
+            stream.close()
+            kernel.close()
+        self.mux_music(muxes, music_path, progress_callback)
+        self.pending_renditions = []
+        return True
+    
+    def render_filtergraph_montage(self, photo_paths: List[str], output_path: str,
+                                   music_path: Optional[str] = None, progress_callback=None) -> bool:
+        """Render the montage with the ffmpeg filter graph backend if it applies
+        
+        Returns False when the Python frame loop has to be used instead.
+        """
+        if not self.supports_filtergraph(len(photo_paths)):
+            return False
+        
+        readable = self.readable_photos(photo_paths, progress_callback)
+        if len(readable) < 2:
+            return False
+        
+        try:
+            self.create_transitions_filtergraph(readable, output_path, music_path=music_path,
+                                                progress_callback=progress_callback)
+            self.pending_renditions = []
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"Error rendering filter graph: {e}. Falling back to frame loop.")
+            return False
+    
+    def render_frame_loop_montage(self, photo_paths: List[str], output_path: str,
+                                  music_path: Optional[str] = None, progress_callback=None) -> str:
+        """Render the montage by blending frames in Python"""
+        # Process photos
+        processed_photos = self.process_photos(photo_paths, progress_callback)
+        
+        if not processed_photos:
+            raise Exception("No photos were processed successfully")
+        
+        if (len(processed_photos) >= 2 or self.hold_duration > 0) and self.use_ffmpeg_encoder():
+            # Encode and mux music straight into the final file
+            video_path = self.create_transitions(
+                processed_photos, progress_callback=progress_callback,
+                output_path=output_path, music_path=music_path)
+            self.add_effects(video_path, progress_callback)
+        else:
             # Create transitions
             video_path = self.create_transitions(processed_photos, progress_callback=progress_callback)
             
@@ -177,21 +1219,237 @@ class MontageGenerator:
             video_path = self.add_effects(video_path, progress_callback)
             
             # Add music if provided
-            final_output = os.path.join(self.output_dir, f"montage_{int(time.time())}.mp4")
-            if music_path and os.path.exists(music_path):
-                video_path = self.add_music(video_path, music_path, final_output, progress_callback)
+            if music_path:
+                video_path = self.add_music(video_path, music_path, output_path, progress_callback)
+            
+            with self.tracer.span("final_copy", path=output_path):
+                if video_path != output_path and output_path.endswith('.m3u8'):
+                    remux(video_path, output_path)
+                elif video_path != output_path:
+                    # Copy video to final location
+                    shutil.copy2(video_path, output_path)
+        
+        return output_path
+    
+    def rendition_targets(self, output_path: str) -> Dict[str, tuple]:
+        """Output path and frame size of every requested rendition, by name
+        
+        Renditions at the profile's own frame size are the main output itself.
+        Drafts are previews and skip extra renditions.
+        """
+        if self.draft:
+            return {}
+        targets = {}
+        base, extension = os.path.splitext(output_path)
+        for rendition in self.renditions:
+            if isinstance(rendition, str):
+                if rendition not in RENDITIONS:
+                    raise ValueError(f"Unknown rendition: {rendition}")
+                name, frame_size = rendition, RENDITIONS[rendition]
+            else:
+                name, frame_size = rendition
+            frame_size = tuple(frame_size)
+            path = output_path if frame_size == tuple(self.frame_size) else f"{base}_{name}{extension}"
+            targets[name] = (path, frame_size)
+        return targets
+    
+    def encode_pending_renditions(self, output_path: str, progress_callback=None):
+        """Scale renditions the render backend could not produce in-pass from the finished montage"""
+        if not self.pending_renditions:
+            return
+        as_progress(progress_callback).start(
+            "renditions", total=len(self.pending_renditions),
+            message=f"Encoding {len(self.pending_renditions)} renditions...")
+        if not ffmpeg_available():
+            print("ffmpeg not found. Skipping extra renditions.")
+            return
+        with self.tracer.span("encode_renditions", renditions=[path for path, _ in self.pending_renditions]):
+            transcode_renditions(output_path, self.pending_renditions, preset=self.x264_preset,
+                                 crf=self.x264_crf, threads=self.encoder_threads)
+        self.pending_renditions = []
+    
+    def generate_montage(self, photo_paths: List[str], music_path: Optional[str] = None, 
+                        progress_callback=None, profile: Optional[str] = None,
+                        renditions: Optional[List] = None) -> Dict[str, str]:
+        """Generate complete montage from photos and music
+        
+        A profile such as "draft" renders a quick preview of the same timeline.
+        Renditions (e.g. ["1080p", "720p", "vertical"]) are all encoded from
+        one decode and one render of the timeline.
+        """
+        if (profile and profile != self.profile) or renditions is not None:
+            generator = self.with_profile(profile or self.profile)
+            if renditions is not None:
+                generator.renditions = list(renditions)
+            return generator.generate_montage(photo_paths, music_path, progress_callback)
+        
+        self.tracer = Tracer() if self.trace else NULL_TRACER
+        # One reporter carries structured events (or the classic messages) through every stage
+        progress_callback = as_progress(progress_callback, self.progress_rate)
+        try:
+            with self.tracer.span("generate_montage", photos=len(photo_paths), profile=self.profile):
+                result = self.request_montage(photo_paths, music_path, progress_callback)
+            if self.tracer.enabled and not result.get("cached"):
+                if result["success"]:
+                    trace_path = f"{os.path.splitext(result['output_path'])[0]}.trace.json"
+                else:
+                    trace_path = os.path.join(self.output_dir, f"montage_{int(time.time())}.trace.json")
+                result["trace_path"] = self.tracer.write(trace_path)
+            return result
+        finally:
+            self.tracer = NULL_TRACER
+    
+    def request_montage(self, photo_paths: List[str], music_path: Optional[str] = None,
+                        progress_callback=None) -> Dict:
+        """Serve a montage request from the library, an identical render in progress, or a new render"""
+        progress_callback = as_progress(progress_callback, self.progress_rate)
+        if not (music_path and os.path.exists(music_path)):
+            music_path = None
+        suffix = "" if self.profile == "final" else f"_{self.profile}"
+        try:
+            with self.tracer.span("fingerprint"):
+                fingerprint = self.request_fingerprint(photo_paths, music_path)
+        except (OSError, ValueError):
+            # Missing inputs and bad settings fail in the render itself
+            fingerprint = None
+        if fingerprint is None:
+            return self.render_montage(photo_paths, music_path, progress_callback,
+                                       f"montage_{int(time.time())}{suffix}")
+        
+        name = f"montage_{fingerprint[:16]}{suffix}"
+        library = self.output_library()
+        while True:
+            with _renders_lock:
+                with self.tracer.span("library_lookup"):
+                    finished = library.lookup(fingerprint) if self.reuse_outputs else None
+                if finished:
+                    progress_callback.start("done", message="Montage generation complete!")
+                    return dict(finished, cached=True, message="Montage already rendered")
+                in_flight = _renders.get(fingerprint)
+                if in_flight is None:
+                    _renders[fingerprint] = threading.Event()
+                    break
+            # An identical request is rendering: wait for it, then pick up its
+            # output (or take over if it failed)
+            progress_callback("Waiting for an identical montage in progress...")
+            in_flight.wait()
+        
+        try:
+            result = self.render_montage(photo_paths, music_path, progress_callback, name)
+            if result["success"]:
+                result["fingerprint"] = fingerprint
+                inputs = {"photos": list(photo_paths), "music": music_path}
+                with self.tracer.span("library_record"):
+                    duration = probe_duration(result["output_path"]) if ffmpeg_available() else None
+                    result["library"] = library.record(fingerprint, result, inputs, self.render_settings(),
+                                                       duration)
+            return result
+        finally:
+            with _renders_lock:
+                _renders.pop(fingerprint).set()
+    
+    def render_settings(self) -> Dict:
+        """Every setting that changes the montage produced
+        
+        Worker counts, caches and other settings that only change how fast a
+        montage renders are left out.
+        """
+        return {
+            "profile": self.profile,
+            "frame_size": list(self.frame_size),
+            "fps": self.fps,
+            "draft": self.draft,
+            "x264_preset": self.x264_preset,
+            "x264_crf": self.x264_crf,
+            "encoder": self.encoder,
+            "backend": self.backend,
+            "hold_duration": self.hold_duration,
+            "music_fit": self.music_fit,
+            "music_fade": self.music_fade,
+            "renditions": sorted([name, list(frame_size)] for name, (_, frame_size)
+                                 in self.rendition_targets("montage.mp4").items()),
+            "output_format": self.output_format,
+            "render_version": RENDER_VERSION,
+        }
+    
+    def request_fingerprint(self, photo_paths: List[str], music_path: Optional[str] = None) -> str:
+        """Hash of the input contents and the render settings of a montage request"""
+        spec = self.timeline or self.timeline_spec(photo_paths, music_path)
+        music_digest = file_digest(music_path) if music_path else None
+        settings = json.dumps(self.render_settings(), sort_keys=True)
+        return settings_digest(spec_fingerprint(spec), music_digest, settings)
+    
+    def output_library(self) -> MontageLibrary:
+        """Index of the montages rendered into the output directory"""
+        budget = int(self.library_budget_mb * 1024 * 1024) if self.library_budget_mb is not None else None
+        return MontageLibrary(os.path.join(self.output_dir, "library.db"), budget)
+    
+    def render_montage(self, photo_paths: List[str], music_path: Optional[str], progress_callback,
+                       name: str) -> Dict:
+        """Render a montage into the output directory under the given name"""
+        progress_callback = as_progress(progress_callback, self.progress_rate)
+        watcher = None
+        timeline = self.timeline
+        if self.canvas_cache:
+            # Caches may be shared with renders on other threads; pins last until all of them finish
+            self.canvas_cache.hold()
+            self.segment_cache.hold()
+            self.audio_cache.hold()
+        self.verified_photos = set()
+        try:
+            # Create temp directory
+            self.create_temp_directory()
+            
+            progress_callback.start("start", message="Starting montage generation...")
+            
+            if self.output_format == "hls":
+                # Playlist and fragments get a directory of their own
+                os.makedirs(os.path.join(self.output_dir, name), exist_ok=True)
+                final_output = os.path.join(self.output_dir, name, "index.m3u8")
             else:
-                # Copy video to final location
-                shutil.copy2(video_path, final_output)
+                final_output = os.path.join(self.output_dir, f"{name}.mp4")
+            if music_path and ffmpeg_available():
+                # Fit the music to the photos that will actually be shown
+                photo_paths = self.readable_photos(photo_paths, progress_callback)
+                self.plan_music(photo_paths, music_path, progress_callback)
+            targets = self.rendition_targets(final_output)
+            self.pending_renditions = [target for target in targets.values() if target[0] != final_output]
             
-            if progress_callback:
-                progress_callback("Montage generation complete!")
+            if self.output_format == "hls":
+                watcher = PlaylistWatcher(final_output, lambda manifest, fragments: progress_callback(
+                    f"Playable fragments: {fragments} ({manifest})")).start()
             
-            return {
+            if not (self.render_segments_montage(photo_paths, final_output, music_path, progress_callback)
+                    or self.render_chunked_montage(photo_paths, final_output, music_path, progress_callback)
+                    or self.render_streaming_montage(photo_paths, final_output, music_path, progress_callback)
+                    or self.render_filtergraph_montage(photo_paths, final_output, music_path, progress_callback)):
+                self.render_frame_loop_montage(photo_paths, final_output, music_path, progress_callback)
+            self.encode_pending_renditions(final_output, progress_callback)
+            if watcher:
+                watcher.stop()
+                watcher = None
+            
+            progress_callback.start("done", message="Montage generation complete!")
+            
+            result = {
                 "success": True,
                 "output_path": final_output,
-                "message": "Montage created successfully"
+                "message": "Montage created successfully",
+                "profile": self.profile,
+                "peak_rss_mb": peak_rss_mb()
             }
+            if self.canvas_cache:
+                result["cache"] = self.canvas_cache.stats()
+                result["segment_cache"] = self.segment_cache.stats()
+                result["audio_cache"] = self.audio_cache.stats()
+            if self.canvas_store:
+                result["canvas_store"] = self.canvas_store.stats()
+            if targets:
+                result["renditions"] = {name: path for name, (path, _) in targets.items()}
+            if self.output_format == "hls":
+                result["manifest_path"] = final_output
+                result["fragments"] = playlist_fragments(final_output)
+            return result
             
         except Exception as e:
             return {
@@ -200,14 +1458,51 @@ class MontageGenerator:
                 "message": f"Failed to create montage: {e}"
             }
         finally:
+            if self.audio_job:
+                # The temp directory may hold the prepared track
+                wait([self.audio_job])
+                self.audio_job = None
+            self.timeline = timeline
+            self.frame_limit = None
+            self.verified_photos = None
+            if watcher:
+                watcher.stop()
             self.cleanup_temp_directory()
+            if self.canvas_cache:
+                self.canvas_cache.unpin_all()
+                self.segment_cache.unpin_all()
+                self.audio_cache.unpin_all()
+
+    def generate_montage_from_spec(self, spec: Dict, progress_callback=None, **options) -> Dict[str, str]:
+        """Generate a montage described by a timeline spec
+        
+        Photos that cannot be read are dropped from the spec first, so the
+        remaining items keep their own holds and transitions. Extra options
+        (profile, renditions) are passed to generate_montage.
+        """
+        validate_spec(spec)
+        readable = set(self.readable_photos(spec_photos(spec), progress_callback))
+        spec = dict(spec, items=[item for item in spec["items"] if item["photo"] in readable])
+        music_path = spec["audio"]["path"] if spec.get("audio") else None
+        
+        generator = copy.copy(self)
+        generator.timeline = spec
+        return generator.generate_montage(spec_photos(spec), music_path, progress_callback, **options)
 
 def create_montage(photo_paths: List[str], music_path: Optional[str] = None, 
-                  progress_callback=None) -> Dict[str, str]:
-    """Main function to create montage"""
-    generator = MontageGenerator()
+                  progress_callback=None, **options) -> Dict[str, str]:
+    """Main function to create montage
+    
+    Extra keyword options (workers, in_memory, encoder, profile, renditions, ...) are passed to MontageGenerator.
+    """
+    generator = MontageGenerator(**options)
     return generator.generate_montage(photo_paths, music_path, progress_callback)
 
+def create_montage_from_spec(spec: Dict, progress_callback=None, **options) -> Dict[str, str]:
+    """Create a montage from a timeline spec (see montage_timeline)"""
+    generator = MontageGenerator(**options)
+    return generator.generate_montage_from_spec(spec, progress_callback)
+
 if __name__ == "__main__":
     # Test the montage generator
     test_photos = [
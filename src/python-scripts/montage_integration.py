@@ -8,6 +8,7 @@ import os
 import sys
 import json
 import tempfile
+from collections import deque
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -62,8 +63,8 @@ def handle_montage_request(request_data: Dict) -> Dict:
                 elif isinstance(music_file, str):
                     temp_music = music_file
             
-            # Create progress callback
-            progress_messages = []
+            # Create progress callback, keeping only the latest messages
+            progress_messages = deque(maxlen=100)
             def progress_callback(message):
                 progress_messages.append(message)
                 print(f"Montage Progress: {message}")
@@ -72,7 +73,7 @@ def handle_montage_request(request_data: Dict) -> Dict:
             result = create_montage(temp_photos, temp_music, progress_callback)
             
             # Add progress messages to result
-            result['progress_messages'] = progress_messages
+            result['progress_messages'] = list(progress_messages)
             
             return result
             
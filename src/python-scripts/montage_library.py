@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Montage Library for Cench AI
+SQLite index of rendered montages with size-budgeted garbage collection
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS montages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fingerprint TEXT NOT NULL UNIQUE,
+    output_path TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    result TEXT NOT NULL,
+    duration REAL,
+    size_bytes INTEGER NOT NULL,
+    last_accessed REAL NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_montages_last_accessed ON montages (last_accessed);
+
+CREATE TABLE IF NOT EXISTS library_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    montage_count INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO library_totals (id, montage_count, total_bytes) VALUES (1, 0, 0);
+
+CREATE TRIGGER IF NOT EXISTS montages_insert AFTER INSERT ON montages BEGIN
+    UPDATE library_totals SET montage_count = montage_count + 1, total_bytes = total_bytes + NEW.size_bytes;
+END;
+
+CREATE TRIGGER IF NOT EXISTS montages_delete AFTER DELETE ON montages BEGIN
+    UPDATE library_totals SET montage_count = montage_count - 1, total_bytes = total_bytes - OLD.size_bytes;
+END;
+"""
+
+
+def output_files(result: Dict) -> List[str]:
+    """Every file or HLS directory a montage result points to"""
+    paths = [result["output_path"]] + list(result.get("renditions", {}).values())
+    # An HLS playlist owns the directory holding its fragments
+    return list(dict.fromkeys(os.path.dirname(path) if path.endswith('.m3u8') else path for path in paths))
+
+
+def disk_usage(path: str) -> int:
+    """Bytes used by a file or a directory tree"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+class MontageLibrary:
+    """Index of rendered montages by request fingerprint
+
+    Lookups, paged listings and totals are served from indexes and a
+    trigger-maintained totals row, never by scanning the output directory.
+    Once the indexed montages outgrow the disk budget, the least recently
+    accessed ones are deleted along with their files.
+    """
+
+    def __init__(self, db_path: str, budget_bytes: Optional[int] = None):
+        self.db_path = db_path
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        with self.connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def record(self, fingerprint: str, result: Dict, inputs: Dict, settings: Dict,
+               duration: Optional[float] = None) -> Dict:
+        """Index a finished render, then evict old renders if the library is over budget"""
+        size = sum(disk_usage(path) for path in output_files(result) if os.path.exists(path))
+        with self.lock, self.connect() as db:
+            db.execute("DELETE FROM montages WHERE fingerprint = ?", (fingerprint,))
+            db.execute(
+                "INSERT INTO montages (fingerprint, output_path, inputs, settings, result, duration,"
+                " size_bytes, last_accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, result["output_path"], json.dumps(inputs), json.dumps(settings),
+                 json.dumps(result), duration, size, time.time()))
+        self.evict(keep=fingerprint)
+        return self.stats()
+
+    def lookup(self, fingerprint: str) -> Optional[Dict]:
+        """Result of a finished render (marking it recently used), or None if its files are gone"""
+        with self.lock, self.connect() as db:
+            row = db.execute("SELECT result FROM montages WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            if row is None:
+                return None
+            result = json.loads(row["result"])
+            if not all(os.path.exists(path) for path in output_files(result)):
+                # Deleted by hand: forget it so the montage is rendered again
+                db.execute("DELETE FROM montages WHERE fingerprint = ?", (fingerprint,))
+                return None
+            db.execute("UPDATE montages SET last_accessed = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+        return result
+
+    def list(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Indexed montages, most recently accessed first"""
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT fingerprint, output_path, inputs, settings, duration, size_bytes, last_accessed, created_at"
+                " FROM montages ORDER BY last_accessed DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        return [dict(row, inputs=json.loads(row["inputs"]), settings=json.loads(row["settings"])) for row in rows]
+
+    def stats(self) -> Dict:
+        """Number and total size of indexed montages against the budget"""
+        with self.connect() as db:
+            row = db.execute("SELECT montage_count, total_bytes FROM library_totals WHERE id = 1").fetchone()
+        return {"montages": row["montage_count"], "bytes": row["total_bytes"], "budget_bytes": self.budget_bytes}
+
+    def remove(self, fingerprint: str) -> bool:
+        """Delete a montage's files and index entry"""
+        with self.lock, self.connect() as db:
+            row = db.execute("SELECT result FROM montages WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            if row is None:
+                return False
+            self.delete_files(json.loads(row["result"]))
+            db.execute("DELETE FROM montages WHERE fingerprint = ?", (fingerprint,))
+        return True
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete least recently accessed montages until the library fits its budget"""
+        if self.budget_bytes is None:
+            return 0
+        evicted = 0
+        with self.lock, self.connect() as db:
+            total = db.execute("SELECT total_bytes FROM library_totals WHERE id = 1").fetchone()[0]
+            rows = db.execute("SELECT fingerprint, result, size_bytes FROM montages ORDER BY last_accessed")
+            for row in rows.fetchall():
+                if total <= self.budget_bytes:
+                    break
+                if row["fingerprint"] == keep:
+                    continue
+                self.delete_files(json.loads(row["result"]))
+                db.execute("DELETE FROM montages WHERE fingerprint = ?", (row["fingerprint"],))
+                total -= row["size_bytes"]
+                evicted += 1
+        return evicted
+
+    @staticmethod
+    def delete_files(result: Dict):
+        for path in output_files(result):
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
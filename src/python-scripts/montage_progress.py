@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Montage Progress for Cench AI
+Structured, rate-limited progress events for montage rendering
+"""
+
+import time
+import threading
+from typing import Callable, NamedTuple, Optional
+
+
+class ProgressEvent(NamedTuple):
+    """Progress of one montage stage
+
+    done and total count the stage's units: photos while decoding, timeline
+    frames while rendering. rate is units per second since the stage began
+    and eta_seconds the time left in the stage at that rate; both are None
+    until they can be estimated.
+    """
+    stage: str
+    done: int
+    total: int
+    rate: Optional[float]
+    eta_seconds: Optional[float]
+    message: str
+
+    @property
+    def fraction(self) -> Optional[float]:
+        return self.done / self.total if self.total else None
+
+
+class ProgressReporter:
+    """Turns pipeline progress into ProgressEvents, at most max_rate per second
+
+    advance() is cheap enough to call per frame: it only counts, and builds
+    an event when the rate allows or the stage completes. Stage changes and
+    notes are always delivered. A reporter is also callable with a plain
+    message, so it can be handed to code that expects a string callback.
+    """
+
+    def __init__(self, callback: Callable[[ProgressEvent], None], max_rate: float = 10.0):
+        self.callback = callback
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self.lock = threading.Lock()
+        self.stage = "start"
+        self.done = 0
+        self.total = 0
+        self.started = time.monotonic()
+        self.next_emit = 0.0
+
+    def start(self, stage: str, total: int = 0, message: str = ""):
+        """Begin a stage of total units"""
+        with self.lock:
+            self.stage = stage
+            self.done = 0
+            self.total = total
+            self.started = time.monotonic()
+        self.emit(message)
+
+    def advance(self, count: int = 1):
+        """Count finished units of the current stage"""
+        self.update(self.done + count)
+
+    def update(self, done: int):
+        """Set the finished units of the current stage"""
+        self.done = done
+        now = time.monotonic()
+        if now >= self.next_emit or (self.total and done >= self.total):
+            self.emit(now=now)
+
+    def __call__(self, message: str):
+        """Report a one-off message within the current stage"""
+        self.emit(message)
+
+    def emit(self, message: str = "", now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            elapsed = now - self.started
+            rate = self.done / elapsed if self.done and elapsed > 0 else None
+            eta = (self.total - self.done) / rate if rate and self.total else None
+            event = ProgressEvent(self.stage, self.done, self.total, rate, eta, message)
+            self.next_emit = now + self.interval
+        self.callback(event)
+
+
+def message_adapter(progress_callback: Callable[[str], None]) -> Callable[[ProgressEvent], None]:
+    """Event callback that forwards events as the classic progress messages"""
+    def on_event(event: ProgressEvent):
+        if event.message:
+            progress_callback(event.message)
+        elif not event.done:
+            return
+        elif event.stage == "decode" and event.total:
+            progress_callback(f"Processing photo {event.done}/{event.total}")
+        elif event.stage == "render" and event.total:
+            progress_callback(f"Creating transitions: {int(event.done * 100 / event.total)}%")
+    return on_event
+
+
+class NullProgress:
+    """Reporter stand-in for when nobody is listening"""
+
+    def start(self, stage: str, total: int = 0, message: str = ""):
+        pass
+
+    def advance(self, count: int = 1):
+        pass
+
+    def update(self, done: int):
+        pass
+
+    def __call__(self, message: str):
+        pass
+
+
+NULL_PROGRESS = NullProgress()
+
+
+def as_progress(progress_callback, max_rate: float = 10.0):
+    """Reporter for a progress_callback: a ProgressReporter as is, a string callback through the adapter"""
+    if progress_callback is None:
+        return NULL_PROGRESS
+    if isinstance(progress_callback, (ProgressReporter, NullProgress)):
+        return progress_callback
+    return ProgressReporter(message_adapter(progress_callback), max_rate)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Montage Store for Cench AI
+Scratch storage for decoded canvases that spills to memory-mapped files
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class CanvasStore:
+    """Fixed-size uint8 canvas slots, kept in RAM up to a budget and then spilled to disk
+
+    Spilled canvases live in numpy.memmap slab files in a scratch directory.
+    Worker processes fill a slot by opening its slab by path, and the
+    renderer reads the slot back as a zero-copy view served from the page
+    cache, so the kernel can evict it under memory pressure.
+    """
+
+    SLOTS_PER_SLAB = 64
+
+    def __init__(self, directory: str, frame_size: Tuple[int, int], resident_budget_mb: float = 0):
+        width, height = frame_size
+        self.directory = directory
+        self.canvas_shape = (height, width, 3)
+        self.canvas_bytes = width * height * 3
+        self.resident_budget = int(resident_budget_mb * 1024 * 1024)
+        self.resident_bytes = 0
+        self.slabs = []
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    @property
+    def slab_shape(self) -> Tuple[int, ...]:
+        return (self.SLOTS_PER_SLAB,) + self.canvas_shape
+
+    def reserve(self) -> Optional[Tuple[str, int]]:
+        """Claim room for one canvas: None if it fits in RAM, else its (slab path, slot)"""
+        with self.lock:
+            if self.resident_bytes + self.canvas_bytes <= self.resident_budget:
+                self.resident_bytes += self.canvas_bytes
+                return None
+
+            slab, slot = divmod(self.next_slot, self.SLOTS_PER_SLAB)
+            if slab == len(self.slabs):
+                path = os.path.join(self.directory, f"canvases_{slab:03d}.slab")
+                # Slabs are sparse, so unused slots cost no disk space
+                self.slabs.append(np.memmap(path, dtype=np.uint8, mode='w+', shape=self.slab_shape))
+            self.next_slot += 1
+            return self.slabs[slab].filename, slot
+
+    def view(self, location: Tuple[str, int]) -> np.ndarray:
+        """Zero-copy view of a filled slot"""
+        path, slot = location
+        for slab in self.slabs:
+            if slab.filename == path:
+                return slab[slot]
+        raise KeyError(path)
+
+    def stats(self) -> Dict:
+        """Resident and spilled footprint of the store"""
+        with self.lock:
+            return {
+                "resident_bytes": self.resident_bytes,
+                "spilled_canvases": self.next_slot,
+                "spilled_bytes": self.next_slot * self.canvas_bytes,
+            }
+
+    def close(self):
+        """Drop the slab mappings so the scratch directory can be removed"""
+        with self.lock:
+            self.slabs = []
+
+
+def fill_slot(location: Tuple[str, int], slab_shape: Tuple[int, ...], canvas: np.ndarray) -> Tuple[str, int]:
+    """Write a canvas into a slab slot from any process"""
+    path, slot = location
+    slab = np.memmap(path, dtype=np.uint8, mode='r+', shape=slab_shape)
+    slab[slot] = canvas
+    slab.flush()
+    del slab
+    return location
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Montage Timeline for Cench AI
+Declarative, serializable montage timelines and a lazy frame evaluator
+"""
+
+import json
+import bisect
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from montage_cache import file_digest
+
+SPEC_VERSION = 1
+TRANSITION_TYPES = ("crossfade", "cut")
+
+
+def timeline_spec(photo_paths: List[str], hold_duration: float = 0.0, transition_duration: float = 1.0,
+                  music_path: Optional[str] = None) -> Dict:
+    """Describe a montage with uniform holds and crossfades as a timeline spec
+
+    Times are in seconds, so one spec renders identically at any frame
+    rate or size.
+    """
+    return {
+        "version": SPEC_VERSION,
+        "items": [
+            {"photo": photo_path, "hold": hold_duration,
+             "transition": {"type": "crossfade", "duration": transition_duration}}
+            for photo_path in photo_paths
+        ],
+        "effects": [],
+        "audio": {"path": music_path} if music_path else None,
+    }
+
+
+def validate_spec(spec: Dict) -> Dict:
+    """Check a timeline spec and return it, raising ValueError if it is malformed"""
+    if spec.get("version") != SPEC_VERSION:
+        raise ValueError(f"Unsupported timeline spec version: {spec.get('version')}")
+    if not isinstance(spec.get("items"), list):
+        raise ValueError("Timeline spec needs a list of items")
+    for item in spec["items"]:
+        if "photo" not in item:
+            raise ValueError("Every timeline item needs a photo")
+        if item.get("hold", 0) < 0:
+            raise ValueError(f"Negative hold for {item['photo']}")
+        transition = item.get("transition") or {"type": "cut"}
+        if transition.get("type") not in TRANSITION_TYPES:
+            raise ValueError(f"Unsupported transition: {transition.get('type')}")
+    if spec.get("effects"):
+        # No timeline effects are implemented by the renderers yet
+        raise ValueError(f"Unsupported effect: {spec['effects'][0].get('type')}")
+    return spec
+
+
+def load_spec(source: str) -> Dict:
+    """Read a timeline spec from a JSON file or a JSON string"""
+    if source.lstrip().startswith('{'):
+        return validate_spec(json.loads(source))
+    with open(source) as f:
+        return validate_spec(json.load(f))
+
+
+def save_spec(spec: Dict, path: str) -> str:
+    """Write a timeline spec as JSON"""
+    with open(path, 'w') as f:
+        json.dump(validate_spec(spec), f, indent=2)
+    return path
+
+
+def spec_photos(spec: Dict) -> List[str]:
+    """Photo paths of a timeline spec, in order"""
+    return [item["photo"] for item in spec["items"]]
+
+
+def spec_segments(spec: Dict, fps: int) -> List[Dict]:
+    """Lay out a timeline spec as hold and transition segments in frames
+
+    Produces the same segments as build_timeline for uniform specs.
+    """
+    segments = []
+    start = 0
+    items = spec["items"]
+
+    for i, item in enumerate(items):
+        hold_frames = int(round(fps * item.get("hold", 0)))
+        if hold_frames > 0:
+            segments.append({"type": "hold", "photo": i, "start": start, "frames": hold_frames})
+            start += hold_frames
+
+        transition = item.get("transition") or {"type": "cut"}
+        transition_frames = int(fps * transition.get("duration", 0)) if transition["type"] == "crossfade" else 0
+        if i < len(items) - 1 and transition_frames > 0:
+            segments.append({"type": "transition", "from": i, "to": i + 1,
+                             "start": start, "frames": transition_frames})
+            start += transition_frames
+
+    return segments
+
+
+def fit_spec_to_duration(spec: Dict, duration: float) -> Dict:
+    """Copy of a spec whose holds are stretched or compressed to last duration seconds
+
+    Holds keep their relative lengths (equal holds if there are none). When
+    the crossfades alone are longer than duration, they are compressed too
+    and the holds drop to zero.
+    """
+    spec = json.loads(json.dumps(spec))
+    items = spec["items"]
+    if not items:
+        return spec
+
+    transitions = []
+    for i, item in enumerate(items):
+        transition = item.get("transition") or {"type": "cut"}
+        crossfade = transition["type"] == "crossfade" and i < len(items) - 1
+        transitions.append(transition.get("duration", 0) if crossfade else 0)
+    total_transitions = sum(transitions)
+
+    if total_transitions >= duration:
+        for item, length in zip(items, transitions):
+            item["hold"] = 0.0
+            if length:
+                item["transition"]["duration"] = length * duration / total_transitions
+        return spec
+
+    available = duration - total_transitions
+    total_holds = sum(item.get("hold", 0) for item in items)
+    for item in items:
+        item["hold"] = item.get("hold", 0) * available / total_holds if total_holds else available / len(items)
+    return spec
+
+
+def truncate_segments(segments: List[Dict], max_frames: int) -> List[Dict]:
+    """Cut a segment list off after max_frames frames
+
+    A transition that would be cut in half is replaced by a hold on the
+    photo it starts from, so the result lasts exactly max_frames.
+    """
+    truncated = []
+    for segment in segments:
+        start = segment["start"]
+        if start >= max_frames:
+            break
+        if start + segment["frames"] <= max_frames:
+            truncated.append(segment)
+        elif segment["type"] == "hold":
+            truncated.append(dict(segment, frames=max_frames - start))
+        else:
+            truncated.append({"type": "hold", "photo": segment["from"], "start": start,
+                              "frames": max_frames - start})
+    return truncated
+
+
+def content_spec(spec: Dict) -> Dict:
+    """Copy of a spec with file paths replaced by content digests"""
+    content = json.loads(json.dumps(spec))
+    for item in content["items"]:
+        item["photo"] = file_digest(item["photo"])
+    if content.get("audio"):
+        content["audio"]["path"] = file_digest(content["audio"]["path"])
+    return content
+
+
+def spec_fingerprint(spec: Dict) -> str:
+    """Stable hash of everything that determines a montage's pixels and sound"""
+    canonical = json.dumps(content_spec(spec), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def segment_fingerprints(spec: Dict, fps: int) -> List[str]:
+    """Fingerprint of each segment, independent of its position in the timeline"""
+    digests = [item["photo"] for item in content_spec(spec)["items"]]
+    fingerprints = []
+    for segment in spec_segments(spec, fps):
+        if segment["type"] == "hold":
+            photos = [digests[segment["photo"]]]
+        else:
+            photos = [digests[segment["from"]], digests[segment["to"]]]
+        key = json.dumps([segment["type"], photos, segment["frames"]])
+        fingerprints.append(hashlib.sha256(key.encode()).hexdigest())
+    return fingerprints
+
+
+def changed_segments(old_spec: Dict, new_spec: Dict, fps: int) -> List[int]:
+    """Indexes of the segments of new_spec whose content no render of old_spec produced"""
+    old = set(segment_fingerprints(old_spec, fps))
+    return [i for i, fingerprint in enumerate(segment_fingerprints(new_spec, fps)) if fingerprint not in old]
+
+
+class TimelineEvaluator:
+    """Compute any frame of a timeline spec on demand
+
+    Only the canvases the requested frame shows are loaded, through the
+    given canvas loader (photo index -> BGR canvas).
+    """
+
+    def __init__(self, spec: Dict, fps: int, canvas: Callable[[int], np.ndarray]):
+        self.spec = validate_spec(spec)
+        self.fps = fps
+        self.canvas = canvas
+        self.segments = spec_segments(spec, fps)
+        self.starts = [segment["start"] for segment in self.segments]
+        self.total_frames = sum(segment["frames"] for segment in self.segments)
+
+    @property
+    def duration(self) -> float:
+        return self.total_frames / self.fps
+
+    def frame_index(self, seconds: float) -> int:
+        """Timeline frame shown at a timestamp, clamped to the montage"""
+        return min(max(int(seconds * self.fps), 0), max(self.total_frames - 1, 0))
+
+    def segment_at(self, n: int) -> Optional[Dict]:
+        """Segment that frame n belongs to"""
+        if not self.segments:
+            return None
+        return self.segments[bisect.bisect_right(self.starts, n) - 1]
+
+    def frame(self, n: int) -> np.ndarray:
+        """BGR frame n of the timeline"""
+        segment = self.segment_at(n)
+        if segment is None:
+            return self.canvas(0)
+        if segment["type"] == "hold":
+            return self.canvas(segment["photo"])
+        # Same blend weights as the frame loop's crossfade kernel
+        alpha = (n - segment["start"]) / segment["frames"]
+        return cv2.addWeighted(self.canvas(segment["from"]), 1.0 - alpha,
+                               self.canvas(segment["to"]), alpha, 0)
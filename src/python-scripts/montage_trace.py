@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Montage Trace for Cench AI
+Opt-in timed spans of montage rendering, written as Chrome trace JSON
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+
+def traced_call(task, *args):
+    """Run a task in a worker process and return its result with its own timing
+
+    Returns (result, start, end, pid, thread name) so the parent can record
+    the span on the worker's track.
+    """
+    start = time.time()
+    result = task(*args)
+    return result, start, time.time(), os.getpid(), threading.current_thread().name
+
+
+class Tracer:
+    """Collects timed spans from any thread and writes them as a Chrome trace
+
+    Timestamps are wall-clock, so spans timed in worker processes line up
+    with the parent's. The file opens in chrome://tracing and Perfetto.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """Time the enclosed block as one span, with args as its metadata"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), **args)
+
+    def add(self, name: str, start: float, end: float, pid: Optional[int] = None,
+            thread: Optional[str] = None, **args):
+        """Record a span timed elsewhere, e.g. by traced_call"""
+        pid = pid or os.getpid()
+        thread = thread or threading.current_thread().name
+        with self.lock:
+            tid = self.threads.setdefault((pid, thread), len(self.threads) + 1)
+            self.events.append({
+                "name": name, "cat": "montage", "ph": "X",
+                "ts": start * 1e6, "dur": (end - start) * 1e6,
+                "pid": pid, "tid": tid, "args": args,
+            })
+
+    def add_call(self, name: str, traced_result, **args):
+        """Record the span of a traced_call and return the task's own result"""
+        result, start, end, pid, thread = traced_result
+        self.add(name, start, end, pid=pid, thread=thread, **args)
+        return result
+
+    def trace(self) -> Dict:
+        """Chrome trace event document of the spans so far"""
+        with self.lock:
+            names = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+                     for (pid, thread), tid in self.threads.items()]
+            return {"traceEvents": names + list(self.events), "displayTimeUnit": "ms"}
+
+    def write(self, path: str) -> str:
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f, default=str)
+        return path
+
+
+class NullTracer:
+    """Tracer stand-in for when tracing is off: every span is a shared no-op"""
+
+    enabled = False
+    _span = nullcontext()
+
+    def span(self, name: str, **args):
+        return self._span
+
+    def add(self, name: str, start: float, end: float, pid: Optional[int] = None,
+            thread: Optional[str] = None, **args):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test Montage Cache for Cench AI
+Checks pinning and LRU eviction of the render caches in temporary directories
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+import numpy as np
+
+from montage_cache import CanvasCache
+
+CANVAS = np.zeros((16, 16, 3), dtype=np.uint8)
+
+
+def entry_bytes(directory: str) -> int:
+    """Size of one cached CANVAS entry"""
+    cache = CanvasCache(os.path.join(directory, "probe"))
+    return os.path.getsize(cache.put("probe", CANVAS))
+
+
+def test_lookup_outside_a_render_does_not_pin():
+    with tempfile.TemporaryDirectory() as directory:
+        size = entry_bytes(directory)
+        cache = CanvasCache(os.path.join(directory, "canvases"), max_bytes=2 * size)
+        first = cache.put("first", CANVAS)
+        cache.put("second", CANVAS)
+        os.utime(first, (1, 1))
+        # What the preview frame server does: look up with no render holding the cache
+        assert cache.get("first") is not None
+        assert not cache.pinned
+        os.utime(first, (1, 1))
+        cache.put("third", CANVAS)
+        assert not os.path.exists(first)
+
+
+def test_held_entries_stay_until_unpin_all():
+    with tempfile.TemporaryDirectory() as directory:
+        size = entry_bytes(directory)
+        cache = CanvasCache(os.path.join(directory, "canvases"), max_bytes=2 * size)
+        cache.hold()
+        first = cache.put("first", CANVAS)
+        os.utime(first, (1, 1))
+        cache.put("second", CANVAS)
+        cache.put("third", CANVAS)
+        # Over budget, but every entry belongs to the running render
+        assert os.path.exists(first)
+        cache.unpin_all()
+        assert not cache.pinned
+        assert not os.path.exists(first)
+        assert cache.size <= cache.max_bytes
+
+
+def test_pins_last_until_every_render_finishes():
+    with tempfile.TemporaryDirectory() as directory:
+        size = entry_bytes(directory)
+        # One cache shared by two renders, as the render daemon's jobs share it
+        cache = CanvasCache(os.path.join(directory, "canvases"), max_bytes=size)
+        cache.hold()
+        first = cache.put("first", CANVAS)
+        os.utime(first, (1, 1))
+        cache.hold()
+        second = cache.put("second", CANVAS)
+        # The render that wrote "second" finishes while the other still reads "first"
+        cache.unpin_all()
+        assert os.path.exists(first) and os.path.exists(second)
+        assert first in cache.pinned
+        cache.unpin_all()
+        assert not cache.pinned
+        assert not os.path.exists(first)
+        assert cache.size <= cache.max_bytes
+        # Unbalanced releases do not leave the count negative
+        cache.unpin_all()
+        assert cache.holders == 0
+
+
+if __name__ == "__main__":
+    print("🎬 TESTING MONTAGE CACHE")
+    print("="*50)
+
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failures = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {name}: {e}")
+
+    print(f"\n{len(tests) - failures}/{len(tests)} cache tests passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test Montage Daemon for Cench AI
+Checks the render queue's ordering, bounds and cancellation without rendering
+"""
+
+import sys
+import os
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+from montage_daemon import RenderDaemon
+
+PHOTOS = ["photo_0.jpg", "photo_1.jpg"]
+
+
+def test_interactive_jobs_run_first_in_submission_order():
+    # Never started, so every job stays queued
+    daemon = RenderDaemon()
+    batch_1 = daemon.submit(PHOTOS)
+    draft_1 = daemon.submit(PHOTOS, profile="draft")
+    batch_2 = daemon.submit(PHOTOS, priority="batch")
+    draft_2 = daemon.submit(PHOTOS, priority="interactive")
+    assert (batch_1.priority, draft_1.priority) == ("batch", "interactive")
+    order = [draft_1, draft_2, batch_1, batch_2]
+    assert [job["id"] for job in daemon.list()] == [job.id for job in order]
+    assert [daemon.status(job.id)["position"] for job in order] == [0, 1, 2, 3]
+
+
+def test_full_queue_refuses_submissions():
+    daemon = RenderDaemon(max_queued=2)
+    daemon.submit(PHOTOS)
+    daemon.submit(PHOTOS)
+    try:
+        daemon.submit(PHOTOS, profile="draft")
+        assert False, "submission past max_queued was accepted"
+    except OverflowError:
+        pass
+    assert daemon.stats()["queued"] == 2
+
+
+def test_cancel_drops_only_queued_jobs():
+    daemon = RenderDaemon()
+    first = daemon.submit(PHOTOS)
+    second = daemon.submit(PHOTOS)
+    assert daemon.cancel(first.id)
+    assert daemon.status(first.id)["state"] == "cancelled"
+    assert daemon.status(second.id)["position"] == 0
+    assert [job["id"] for job in daemon.list()] == [second.id, first.id]
+    # Already cancelled, or never submitted
+    assert not daemon.cancel(first.id)
+    assert not daemon.cancel("missing")
+    assert daemon.stats()["queued"] == 1
+
+
+if __name__ == "__main__":
+    print("🎬 TESTING MONTAGE DAEMON")
+    print("="*50)
+
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failures = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {name}: {e}")
+
+    print(f"\n{len(tests) - failures}/{len(tests)} daemon tests passed")
+    sys.exit(1 if failures else 0)
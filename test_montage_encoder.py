@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test Montage Encoder for Cench AI
+Checks the ffmpeg expressions and pipe writer on small synthetic timelines
+"""
+
+import sys
+import os
+import re
+import subprocess
+import tempfile
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+import numpy as np
+
+from montage_encoder import (FFmpegPipeWriter, ffmpeg_available, fit_audio, hold_select_expression,
+                             sent_frame_expression)
+from montage_generator import build_timeline
+
+FRAME_SIZE = (64, 48)
+
+
+def frame_count(video_path: str) -> int:
+    """Frames of a video's first video stream, decoded by ffmpeg"""
+    stderr = subprocess.run(['ffmpeg', '-i', video_path, '-map', '0:v', '-f', 'null', '-'],
+                            capture_output=True, text=True).stderr
+    return int(re.findall(r'frame=\s*(\d+)', stderr)[-1])
+
+
+def write_frames(out, count: int):
+    for i in range(count):
+        out.write(np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), i * 8 % 256, dtype=np.uint8))
+
+
+def evaluate(expression: str, **variables) -> float:
+    """Evaluate an ffmpeg expression built from if/lt/eq and arithmetic"""
+    functions = {"iff": lambda c, a, b: a if c else b, "lt": lambda a, b: a < b, "eq": lambda a, b: a == b}
+    return eval(expression.replace("if(", "iff("), functions, variables)
+
+
+def test_sent_frame_expression_maps_sent_frames():
+    for segments in (build_timeline(5, 6, 4), build_timeline(4, 0, 3), build_timeline(3, 5, 1)):
+        expression, sent = sent_frame_expression(segments)
+        # What write_segment sends: one frame per hold, every frame of a transition
+        expected = []
+        for segment in segments:
+            if segment["type"] == "hold":
+                expected.append(segment["start"])
+            else:
+                expected.extend(range(segment["start"], segment["start"] + segment["frames"]))
+        last = segments[-1]
+        if last["type"] == "hold" and last["frames"] > 1:
+            expected.append(last["start"] + last["frames"] - 1)
+        assert sent == len(expected)
+        assert [evaluate(expression, N=n) for n in range(sent)] == expected
+
+
+def test_hold_select_expression_drops_hold_interiors():
+    segments = build_timeline(4, 6, 5)
+    expression = hold_select_expression(segments)
+    interior = {frame for segment in segments if segment["type"] == "hold" and segment["frames"] > 2
+                for frame in range(segment["start"] + 1, segment["start"] + segment["frames"] - 1)}
+    total = sum(segment["frames"] for segment in segments)
+    kept = [n for n in range(total) if evaluate(expression, n=n)]
+    assert kept == [n for n in range(total) if n not in interior]
+
+
+def test_fitted_music_keeps_every_frame():
+    if not ffmpeg_available():
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        tone = os.path.join(directory, "tone.wav")
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', 'sine=d=5', tone], check=True)
+        # 30 frames at 12 fps, with the track fitted to exactly that length as plan_music does
+        music = fit_audio(tone, 30 / 12, os.path.join(directory, "music.m4a"))
+        output = os.path.join(directory, "montage.mp4")
+        out = FFmpegPipeWriter(output, 12, FRAME_SIZE, music_path=music, preset="ultrafast", shortest=False)
+        write_frames(out, 30)
+        out.release()
+        assert frame_count(output) == 30
+
+
+def test_aborted_writer_leaves_nothing_behind():
+    if not ffmpeg_available():
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        segments = build_timeline(3, 4, 6)
+        expression, _ = sent_frame_expression(segments)
+        out = FFmpegPipeWriter(os.path.join(directory, "montage.mp4"), 12, FRAME_SIZE, preset="ultrafast",
+                               frame_expression=expression)
+        assert os.path.exists(out.script)
+        write_frames(out, 3)
+        out.abort()
+        assert out.process.poll() is not None
+        assert not os.path.exists(out.script)
+
+
+if __name__ == "__main__":
+    print("🎬 TESTING MONTAGE ENCODER")
+    print("="*50)
+
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failures = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {name}: {e}")
+
+    print(f"\n{len(tests) - failures}/{len(tests)} encoder tests passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test Montage Library for Cench AI
+Checks the output index and its disk budget on placeholder files
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+from montage_library import MontageLibrary
+
+MONTAGE_BYTES = 1000
+
+
+def record_montage(library: MontageLibrary, directory: str, name: str) -> dict:
+    """Write a placeholder montage file and index it under its name as fingerprint"""
+    path = os.path.join(directory, f"{name}.mp4")
+    with open(path, "wb") as f:
+        f.write(b"\0" * MONTAGE_BYTES)
+    result = {"success": True, "output_path": path}
+    library.record(name, result, {"photos": [], "music": None}, {"profile": "final"})
+    return result
+
+
+def test_totals_follow_record_and_remove():
+    with tempfile.TemporaryDirectory() as directory:
+        library = MontageLibrary(os.path.join(directory, "library.db"))
+        for name in ("a", "b", "c"):
+            record_montage(library, directory, name)
+        assert library.stats() == {"montages": 3, "bytes": 3 * MONTAGE_BYTES, "budget_bytes": None}
+        # Recording the same request again replaces its row
+        record_montage(library, directory, "b")
+        assert library.stats()["montages"] == 3
+        assert library.remove("a")
+        assert not library.remove("a")
+        assert not os.path.exists(os.path.join(directory, "a.mp4"))
+        assert library.stats() == {"montages": 2, "bytes": 2 * MONTAGE_BYTES, "budget_bytes": None}
+
+
+def test_evict_drops_least_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        library = MontageLibrary(os.path.join(directory, "library.db"), budget_bytes=2 * MONTAGE_BYTES)
+        record_montage(library, directory, "a")
+        record_montage(library, directory, "b")
+        # Reading "a" makes "b" the least recently used
+        assert library.lookup("a")
+        record_montage(library, directory, "c")
+        assert [row["fingerprint"] for row in library.list()] == ["c", "a"]
+        assert not os.path.exists(os.path.join(directory, "b.mp4"))
+        assert library.stats()["bytes"] == 2 * MONTAGE_BYTES
+
+        # The montage just recorded is kept even if it alone is over budget
+        library.budget_bytes = MONTAGE_BYTES // 2
+        assert library.evict(keep="c") == 1
+        assert [row["fingerprint"] for row in library.list()] == ["c"]
+        assert os.path.exists(os.path.join(directory, "c.mp4"))
+
+
+def test_lookup_forgets_deleted_files():
+    with tempfile.TemporaryDirectory() as directory:
+        library = MontageLibrary(os.path.join(directory, "library.db"))
+        result = record_montage(library, directory, "a")
+        assert library.lookup("a") == result
+        os.remove(result["output_path"])
+        assert library.lookup("a") is None
+        assert library.stats()["montages"] == 0
+        assert library.lookup("missing") is None
+
+
+if __name__ == "__main__":
+    print("🎬 TESTING MONTAGE LIBRARY")
+    print("="*50)
+
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failures = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {name}: {e}")
+
+    print(f"\n{len(tests) - failures}/{len(tests)} library tests passed")
+    sys.exit(1 if failures else 0)
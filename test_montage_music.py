@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Test Montage Music for Cench AI
+Checks how the timeline is fitted to a music track, down to a full render
+"""
+
+import sys
+import os
+import re
+import subprocess
+import tempfile
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+import numpy as np
+from PIL import Image
+
+from montage_encoder import ffmpeg_available, probe_duration
+from montage_generator import MontageGenerator, build_timeline
+from montage_timeline import fit_spec_to_duration, spec_segments, timeline_spec, truncate_segments
+
+MUSIC_SECONDS = 8.0
+
+
+def video_duration(path: str, directory: str) -> float:
+    """Length of a file's video stream alone; the container lasts as long as the music"""
+    video_only = os.path.join(directory, "video_only.mp4")
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-map', '0:v', '-c', 'copy', video_only],
+                   check=True)
+    return probe_duration(video_only)
+
+
+def stream_types(path: str) -> list:
+    """Kinds of the streams in a file, e.g. ["Video", "Audio"]"""
+    stderr = subprocess.run(['ffmpeg', '-i', path], capture_output=True, text=True).stderr
+    return re.findall(r'Stream #0:\d+.*?: (Video|Audio)', stderr)
+
+
+def make_inputs(directory: str, count: int = 4) -> tuple:
+    """Small test photos and a MUSIC_SECONDS tone"""
+    photos = []
+    for i in range(count):
+        path = os.path.join(directory, f"photo_{i}.jpg")
+        Image.fromarray(np.full((120, 160, 3), i * 60, dtype=np.uint8)).save(path)
+        photos.append(path)
+    music = os.path.join(directory, "music.wav")
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f'sine=d={MUSIC_SECONDS}', music],
+                   check=True)
+    return photos, music
+
+
+def total_frames(segments):
+    return sum(segment["frames"] for segment in segments)
+
+
+def test_truncate_lasts_exactly_max_frames():
+    segments = build_timeline(4, 30, 15)
+    for max_frames in range(1, total_frames(segments) + 1):
+        truncated = truncate_segments(segments, max_frames)
+        assert total_frames(truncated) == max_frames, max_frames
+        assert all(segment["frames"] > 0 for segment in truncated)
+    assert truncate_segments(segments, total_frames(segments) + 100) == segments
+
+
+def test_truncated_transition_holds_its_first_photo():
+    segments = build_timeline(3, 30, 10)
+    # Frames 10..39 are the first transition; cut it after 20 frames
+    truncated = truncate_segments(segments, 30)
+    assert truncated[-1] == {"type": "hold", "photo": 0, "start": 10, "frames": 20}
+
+
+def test_fit_spec_totals_duration():
+    photos = [f"photo_{i}.jpg" for i in range(5)]
+    for hold, transition in ((0.0, 1.0), (2.0, 1.0), (0.5, 0.0)):
+        spec = timeline_spec(photos, hold, transition)
+        # Long enough to stretch the holds, and too short even for the crossfades
+        for duration in (60.0, 7.3, 2.0):
+            fitted = fit_spec_to_duration(spec, duration)
+            crossfades = sum(item["transition"]["duration"] for item in fitted["items"][:-1]
+                             if item["transition"]["type"] == "crossfade")
+            holds = sum(item["hold"] for item in fitted["items"])
+            assert abs(crossfades + holds - duration) < 1e-9, (hold, transition, duration)
+            assert all(item["hold"] >= 0 for item in fitted["items"])
+
+
+def test_fit_spec_frames_match_duration():
+    spec = timeline_spec([f"photo_{i}.jpg" for i in range(8)], 1.0, 1.0)
+    for fps in (12, 30):
+        for duration in (5.0, 30.0, 95.5):
+            frames = total_frames(spec_segments(fit_spec_to_duration(spec, duration), fps))
+            # Each segment rounds to whole frames on its own
+            assert abs(frames - duration * fps) <= len(spec["items"]) * 2, (fps, duration, frames)
+
+
+def test_unreadable_photo_is_left_out_of_the_music_fit():
+    if not ffmpeg_available():
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        photos, music = make_inputs(directory)
+        corrupt = os.path.join(directory, "corrupt.jpg")
+        with open(corrupt, "wb") as f:
+            f.write(b"not a jpeg" * 16)
+        photos.insert(2, corrupt)
+
+        for encoder in ("ffmpeg", "opencv"):
+            generator = MontageGenerator(encoder=encoder, profile="draft", music_fit="holds",
+                                         output_dir=os.path.join(directory, encoder))
+            result = generator.generate_montage(photos, music)
+            assert result["success"], result
+            duration = video_duration(result["output_path"], directory)
+            # Without the corrupt photo in the fit, the holds stretch the video to the music
+            assert abs(duration - MUSIC_SECONDS) < 0.25, (encoder, duration)
+
+
+def test_music_is_muxed_after_the_render():
+    if not ffmpeg_available():
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        photos, music = make_inputs(directory)
+        # Filter graph with an extra rendition, streaming pipeline, and the ffmpeg pipe frame loop
+        backends = [
+            ("filtergraph", dict(profile="final", renditions=[("small", (320, 180))])),
+            ("streaming", dict(profile="draft", streaming=True)),
+            ("frames", dict(profile="draft", encoder="ffmpeg", backend="frames")),
+        ]
+        for name, options in backends:
+            generator = MontageGenerator(music_fit="holds", output_dir=os.path.join(directory, name), **options)
+            result = generator.generate_montage(photos, music)
+            assert result["success"], (name, result)
+            outputs = [result["output_path"]] + [path for path in result.get("renditions", {}).values()
+                                                 if path != result["output_path"]]
+            for output in outputs:
+                assert stream_types(output) == ["Video", "Audio"], (name, output, stream_types(output))
+                assert abs(probe_duration(output) - MUSIC_SECONDS) < 0.25, (name, output)
+                assert abs(video_duration(output, directory) - MUSIC_SECONDS) < 0.25, (name, output)
+
+
+if __name__ == "__main__":
+    print("🎬 TESTING MONTAGE MUSIC")
+    print("="*50)
+
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failures = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {name}: {e}")
+
+    print(f"\n{len(tests) - failures}/{len(tests)} music tests passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test Montage Timeline for Cench AI
+Checks the pure timeline layout functions on small synthetic data
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the project path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, 'src', 'python-scripts'))
+
+from montage_generator import build_timeline
+from montage_timeline import changed_segments, spec_segments, timeline_spec
+
+LAYOUTS = [(fps, hold, transition) for fps in (12, 24, 30) for hold in (0.0, 0.5, 2.0) for transition in (0.0, 1.0)]
+
+
+def test_uniform_spec_matches_build_timeline():
+    photos = [f"photo_{i}.jpg" for i in range(5)]
+    for fps, hold, transition in LAYOUTS:
+        spec = timeline_spec(photos, hold, transition)
+        expected = build_timeline(len(photos), int(fps * transition), int(round(fps * hold)))
+        assert spec_segments(spec, fps) == expected, (fps, hold, transition)
+
+
+def test_segments_are_contiguous():
+    for segments in (build_timeline(6, 30, 15), build_timeline(6, 12, 0), build_timeline(1, 30, 60)):
+        start = 0
+        for segment in segments:
+            assert segment["start"] == start
+            start += segment["frames"]
+
+
+def test_changed_segments_only_touch_changed_photo():
+    with tempfile.TemporaryDirectory() as directory:
+        photos = []
+        for i in range(5):
+            path = os.path.join(directory, f"photo_{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(bytes([i]) * 64)
+            photos.append(path)
+        replacement = os.path.join(directory, "replacement.jpg")
+        with open(replacement, "wb") as f:
+            f.write(b"new" * 64)
+
+        old = timeline_spec(photos, 1.0, 1.0)
+        assert changed_segments(old, old, 30) == []
+        new = timeline_spec(photos[:2] + [replacement] + photos[3:], 1.0, 1.0)
+        segments = spec_segments(new, 30)
+        changed = changed_segments(old, new, 30)
+        assert changed
+        for i in changed:
+            segment = segments[i]
+            assert 2 in (segment.get("photo"), segment.get("from"), segment.get("to")), segment
+
+
+if __name__ == "__main__":
+    print("🎬 TESTING MONTAGE TIMELINE")
+    print("="*50)
+
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failures = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {name}: {e}")
+
+    print(f"\n{len(tests) - failures}/{len(tests)} timeline tests passed")
+    sys.exit(1 if failures else 0)